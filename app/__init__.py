@@ -1,13 +1,16 @@
 from flask import Flask
 from app.models import db
-from app.extensions import ma
+from app.extensions import ma, cache
+from app.utils.serializers import FastJSONProvider
 from app.blueprints.bookmarks import bookmarks_bp
 from app.blueprints.users import users_bp
 from app.blueprints.manga import manga_bp
 from app.blueprints.chapters import chapters_bp
 from app.blueprints.downloads import downloads_bp
 from app.blueprints.reading_history import reading_history_bp
-from config import DevelopmentConfig, TestingConfig, ProductionConfig
+from app.cli import register_commands
+from app.utils.history import init_history
+from config import DevelopmentConfig, TestingConfig, BenchmarkConfig, ProductionConfig
 from flask_swagger_ui import get_swaggerui_blueprint
 
 SWAGGER_URL = '/api/docs'
@@ -24,15 +27,19 @@ swaggerui_blueprint = get_swaggerui_blueprint(
 config_map = {
     'DevelopmentConfig': DevelopmentConfig,
     'TestingConfig': TestingConfig,
+    'BenchmarkConfig': BenchmarkConfig,
     'ProductionConfig': ProductionConfig
 }
 
 def create_app(config_name):
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     app.config.from_object(config_map[config_name])
     
     db.init_app(app)
     ma.init_app(app)
+    cache.init_app(app)
+    init_history(app)
     
     app.register_blueprint(bookmarks_bp, url_prefix='/bookmarks')
     app.register_blueprint(users_bp, url_prefix='/users')
@@ -41,5 +48,7 @@ def create_app(config_name):
     app.register_blueprint(downloads_bp, url_prefix='/download')
     app.register_blueprint(reading_history_bp, url_prefix='/history')
     app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+    
+    register_commands(app)
 
     return app
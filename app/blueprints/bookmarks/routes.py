@@ -1,9 +1,17 @@
-from .schema import bookmark_schema, bookmarks_schema
+from .schema import BookmarkSchema, BookmarkLibrarySchema, bookmark_schema, sync_operations_schema
+from datetime import datetime, timezone
 from flask import request, jsonify
 from marshmallow import ValidationError
-from sqlalchemy import select, and_
-from app.models import Bookmark, db
+from sqlalchemy import select, and_, func, update, delete, bindparam, case, not_, Boolean
+from sqlalchemy.orm import aliased, selectinload
+from app.models import Bookmark, Chapter, Manga, ReadingHistory, db, manga_chapter_count
 from . import bookmarks_bp
+from app.blueprints.manga.schema import manga_schema
+from app.utils.pagination import keyset_paginate, parse_sort, order_by_clauses, InvalidCursor, InvalidSort, InvalidPerPage
+from app.utils.fields import sparse_fieldset, requested_fields, InvalidFields
+from app.utils.serializers import row_serializer
+from app.utils.export import json_array_response
+from app.utils.upsert import upsert
 from app.utils.util import user_required
 
 @bookmarks_bp.route('/', methods=['POST'])
@@ -17,20 +25,26 @@ def add_bookmark():
         print("VALIDATION ERROR:", e.messages)
         return jsonify({'message': 'Validation error', 'errors': e.messages}), 400
     
-    existing = db.session.execute(
+    row = {
+        column.key: getattr(bookmark_data, column.key)
+        for column in Bookmark.__table__.columns
+        if column.key != 'id' and getattr(bookmark_data, column.key) is not None
+    }
+    result = upsert(db.session, Bookmark.__table__, row, ['user_id', 'manga_id'])
+    
+    if not result.inserted:
+        db.session.rollback()
+        return jsonify({'message': 'Bookmark already exists'}), 409
+    
+    db.session.commit()
+    bookmark_data = db.session.execute(
         select(Bookmark).where(
             and_(
                 Bookmark.user_id == request.user_id,
-                Bookmark.manga_id == bookmark_data.manga_id
+                Bookmark.manga_id == str(bookmark_data.manga_id)
             )
         )
-    ).scalar_one_or_none()
-    
-    if existing:
-        return jsonify({'message': 'Bookmark already exists'}), 409
-    
-    db.session.add(bookmark_data)
-    db.session.commit()
+    ).scalar_one()
     return jsonify({
         'message': 'Bookmark added successfully',
         'bookmark': bookmark_schema.dump(bookmark_data)
@@ -39,40 +53,58 @@ def add_bookmark():
 @bookmarks_bp.route('/toggle/<string:manga_id>', methods=['POST'])
 @user_required
 def toggle_bookmark(manga_id):
-    existing = db.session.execute(
-        select(Bookmark).where(
+    removed = db.session.execute(
+        delete(Bookmark).where(
             (Bookmark.user_id == request.user_id) &
             (Bookmark.manga_id == manga_id)
         )
-    ).scalar_one_or_none()
+    )
     
-    if existing:
-        db.session.delete(existing)
+    if removed.rowcount:
         db.session.commit()
         return jsonify({'message': 'Bookmark removed'}), 200
     else:
-        new_bookmark = Bookmark(user_id=request.user_id, manga_id=manga_id)
-        db.session.add(new_bookmark)
+        # a concurrent toggle that added it first leaves the same end state
+        upsert(db.session, Bookmark.__table__, {'user_id': request.user_id, 'manga_id': manga_id}, ['user_id', 'manga_id'])
         db.session.commit()
         return jsonify({'message': 'Bookmark added'}), 201
     
 @bookmarks_bp.route("/", methods=['GET'])
 def get_bookmarks():
     try:
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        serializer = row_serializer(BookmarkSchema, requested_fields(BookmarkSchema))
+        query = serializer.select(Bookmark.id)
+        
+        if 'cursor' in request.args:
+            bookmarks, next_cursor = keyset_paginate(
+                query, [(Bookmark.id, False)], request.args['cursor'], per_page, scalars=False
+            )
+            return jsonify({
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'bookmarks': serializer.dump(bookmarks)
+            }), 200
+        
+        page = int(request.args.get('page', 1))
         offset = (page - 1) * per_page
         total_count = db.session.query(Bookmark).count()
         
-        query = select(Bookmark).offset(offset).limit(per_page)
-        bookmarks = db.session.execute(query).scalars().all()
+        query = query.order_by(Bookmark.id).offset(offset).limit(per_page)
+        bookmarks = db.session.execute(query).all()
         
         return jsonify({
             'page': page,
             'per_page': per_page,
             'total_bookmarks': total_count,
-            'bookmarks': bookmarks_schema.dump(bookmarks)
+            'bookmarks': serializer.dump(bookmarks)
         }), 200
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'message': 'Error fetching Bookmarks', 'error': str(e)}), 500
     
@@ -89,26 +121,245 @@ def get_bookmark_by_id(id):
     
     return jsonify(bookmark_schema.dump(bookmark)), 200
 
+SORTABLE_COLUMNS = {
+    'added_at': Bookmark.added_at,
+    'last_updated': Bookmark.last_updated
+}
+
+def dump_library(schema, bookmarks, expand):
+    results = schema.dump(bookmarks)
+    if 'manga' in expand:
+        for result, bookmark in zip(results, bookmarks):
+            result['manga'] = manga_schema.dump(bookmark.manga) if bookmark.manga else None
+    return results
+
 @bookmarks_bp.route('/user', methods=['GET'])
 @user_required
 def get_my_bookmarks():
+    expand = {name.strip() for name in request.args.get('expand', '').split(',') if name.strip()}
+    if expand - {'manga'}:
+        return jsonify({'message': 'expand supports: manga'}), 400
+    
+    sort = request.args.get('sort')
+    favorited = request.args.get('favorited')
+    
+    try:
+        order = parse_sort(sort, SORTABLE_COLUMNS, Bookmark.id) if sort else [(Bookmark.id, False)]
+        query = select(Bookmark).where(Bookmark.user_id == request.user_id)
+        if favorited is not None:
+            query = query.where(Bookmark.favorited == (favorited.lower() in ('1', 'true', 'yes')))
+        if 'manga' in expand:
+            query = query.options(selectinload(Bookmark.manga))
+        # the library schema dumps manga_id as the uuid string it is rather than BookmarkSchema's int
+        query, schema = sparse_fieldset(query, Bookmark, BookmarkLibrarySchema, many=True, keep=[Bookmark.manga_id] + [c for c, _ in order])
+        
+        if 'cursor' in request.args or 'per_page' in request.args:
+            per_page = int(request.args.get('per_page', 50))
+            bookmarks, next_cursor = keyset_paginate(query, order, request.args.get('cursor'), per_page)
+        else:
+            # unpaged, the whole library is streamed rather than materialized
+            return json_array_response(
+                query.order_by(*order_by_clauses(order)),
+                lambda bookmarks: dump_library(schema, bookmarks, expand),
+                'bookmarks', scalars=True
+            )
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except InvalidSort:
+        return jsonify({'message': f"Invalid sort. Use one of: {', '.join(sorted(SORTABLE_COLUMNS))}, optionally prefixed with '-'"}), 400
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    except ValueError:
+        return jsonify({'message': 'per_page must be an integer'}), 400
+    
+    return jsonify({
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'bookmarks': dump_library(schema, bookmarks, expand)
+    }), 200
+
+@bookmarks_bp.route('/user/unread', methods=['GET'])
+@user_required
+def get_unread_counts():
+    # the read position is the last chapter opened according to reading history, else the chapter
+    # whose number matches the bookmark's last_read_chapter in the requested language. Chapters up to
+    # it are counted against the precomputed total. That count is a range scan of ix_chapter_manga_listing
+    # (manga_id, language, sort_key) per bookmark, touching only index entries up to the read position,
+    # so the cost is bounded by the chapters the user has actually read, not by the catalog
+    default_language = request.args.get('language', 'en')
+    opened = aliased(Chapter)
+    numbered = aliased(Chapter)
+    read = aliased(Chapter)
+    language = func.coalesce(opened.language, numbered.language, default_language)
+    position = func.coalesce(opened.sort_key, numbered.sort_key)
+    
+    query = (
+        select(
+            Bookmark.id,
+            Bookmark.manga_id,
+            func.max(language).label('language'),
+            func.coalesce(func.max(manga_chapter_count.c.chapter_count), 0).label('total'),
+            func.count(read.id.distinct()).label('read')
+        )
+        .outerjoin(ReadingHistory, and_(ReadingHistory.user_id == Bookmark.user_id, ReadingHistory.manga_id == Bookmark.manga_id))
+        .outerjoin(opened, opened.id == ReadingHistory.last_chapter)
+        .outerjoin(numbered, and_(
+            opened.id.is_(None),
+            numbered.manga_id == Bookmark.manga_id,
+            numbered.language == default_language,
+            numbered.chapter_number == Bookmark.last_read_chapter
+        ))
+        .outerjoin(manga_chapter_count, and_(manga_chapter_count.c.manga_id == Bookmark.manga_id, manga_chapter_count.c.language == language))
+        .outerjoin(read, and_(
+            read.manga_id == Bookmark.manga_id,
+            read.language == language,
+            read.sort_key <= position
+        ))
+        .where(Bookmark.user_id == request.user_id)
+        .group_by(Bookmark.id, Bookmark.manga_id)
+        .order_by(Bookmark.id)
+    )
+    
+    rows = db.session.execute(query).all()
+    
+    return jsonify({'unread': [{
+        'bookmark_id': row.id,
+        'manga_id': row.manga_id,
+        'language': row.language,
+        'total_chapters': row.total,
+        'unread': max(row.total - row.read, 0)
+    } for row in rows]}), 200
+
+MAX_SYNC_OPERATIONS = 1000
+
+def collapse_operations(operations, now):
+    # folds the ordered ops into one final state per manga. favorited/last_read_chapter stay None
+    # when no op set them so the existing value is kept; a remove resets them to the defaults a
+    # fresh bookmark would get, and a favorite op without a value flips whatever it ends up on
+    states = {}
+    for operation in operations:
+        state = states.setdefault(operation['manga_id'], {
+            'exists': True, 'favorited': None, 'flip': False, 'last_read_chapter': None, 'added_at': None
+        })
+        op = operation['op']
+        
+        if op == 'remove':
+            state.update(exists=False, favorited=False, flip=False, last_read_chapter='1', added_at=now)
+            continue
+        
+        state['exists'] = True
+        if 'favorited' in operation:
+            state.update(favorited=operation['favorited'], flip=False)
+        elif op == 'favorite':
+            if state['favorited'] is None:
+                state['flip'] = not state['flip']
+            else:
+                state['favorited'] = not state['favorited']
+        if 'last_read_chapter' in operation:
+            state['last_read_chapter'] = operation['last_read_chapter']
+    return states
+
+def apply_sync(user_id, states, now):
+    # no read-then-write: missing bookmarks are inserted-or-ignored with a fresh bookmark's defaults,
+    # then one UPDATE applies every kept state on top of whatever row is there, so a concurrent sync
+    # or add_bookmark never trips unique_user_bookmark
+    table = Bookmark.__table__
+    removes = [manga_id for manga_id, state in states.items() if not state['exists']]
+    kept = [manga_id for manga_id, state in states.items() if state['exists']]
+    
+    removed = 0
+    if removes:
+        removed = db.session.execute(delete(table).where(table.c.user_id == user_id, table.c.manga_id.in_(removes))).rowcount
+    
+    added = 0
+    if kept:
+        added = upsert(db.session, table, [{
+            'user_id': user_id, 'manga_id': manga_id, 'favorited': False,
+            'last_read_chapter': '1', 'added_at': now, 'last_updated': now
+        } for manga_id in kept], ['user_id', 'manga_id']).inserted
+        # unset fields bind NULL and fall back to the stored value; a valueless favorite flips it
+        db.session.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.manga_id == bindparam('key_manga_id'))
+            .values(
+                favorited=case(
+                    (bindparam('flip', type_=Boolean), not_(table.c.favorited)),
+                    else_=func.coalesce(bindparam('favorited', type_=Boolean), table.c.favorited)
+                ),
+                last_read_chapter=func.coalesce(bindparam('last_read_chapter'), table.c.last_read_chapter),
+                added_at=func.coalesce(bindparam('added_at'), table.c.added_at),
+                last_updated=now
+            ),
+            [{
+                'key_manga_id': manga_id,
+                'flip': states[manga_id]['favorited'] is None and states[manga_id]['flip'],
+                'favorited': states[manga_id]['favorited'],
+                'last_read_chapter': states[manga_id]['last_read_chapter'],
+                'added_at': states[manga_id]['added_at']
+            } for manga_id in kept]
+        )
+    
+    return {'added': added, 'updated': len(kept) - added, 'removed': removed}
+
+@bookmarks_bp.route('/sync', methods=['POST'])
+@user_required
+def sync_bookmarks():
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_SYNC_OPERATIONS:
+        return jsonify({'message': f"A sync accepts at most {MAX_SYNC_OPERATIONS} operations"}), 400
+    
+    try:
+        operations = sync_operations_schema.load(operations)
+    except ValidationError as e:
+        return jsonify({'message': 'Validation error', 'errors': e.messages}), 400
+    
+    now = datetime.now(timezone.utc)
+    states = collapse_operations(operations, now)
+    kept = [manga_id for manga_id, state in states.items() if state['exists']]
+    known = set(db.session.execute(select(Manga.id).where(Manga.id.in_(kept))).scalars()) if kept else set()
+    unknown = [manga_id for manga_id in kept if manga_id not in known]
+    if unknown:
+        return jsonify({'message': 'Unknown manga', 'manga_ids': unknown}), 404
+    
+    try:
+        counts = apply_sync(request.user_id, states, now)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Error syncing bookmarks', 'error': str(e)}), 500
+    
     bookmarks = db.session.execute(
-        select(Bookmark).where(Bookmark.user_id == request.user_id)
+        select(Bookmark).where(Bookmark.user_id == request.user_id).order_by(Bookmark.id)
     ).scalars().all()
     
-    return jsonify({'bookmarks': bookmarks_schema.dump(bookmarks)}), 200
+    return jsonify({
+        'operations': len(operations),
+        **counts,
+        'bookmarks': BookmarkLibrarySchema(many=True).dump(bookmarks)
+    }), 200
 
 @bookmarks_bp.route('/manga/<string:manga_id>', methods=['GET'])
 @user_required
 def get_bookmarks_for_manga(manga_id):
-    bookmarks = db.session.execute(
-        select(Bookmark).where(
-            (Bookmark.manga_id == manga_id) &
-            (Bookmark.user_id == request.user_id)
+    try:
+        query, schema = sparse_fieldset(
+            select(Bookmark).where(
+                (Bookmark.manga_id == manga_id) &
+                (Bookmark.user_id == request.user_id)
+            ),
+            Bookmark, BookmarkSchema, many=True
         )
-    ).scalars().all()
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    
+    bookmarks = db.session.execute(query).scalars().all()
     
-    return jsonify({'bookmarks': bookmarks_schema.dump(bookmarks)}), 200
+    return jsonify({'bookmarks': schema.dump(bookmarks)}), 200
 
 @bookmarks_bp.route('/<int:id>', methods=['PUT'])
 @user_required
@@ -1,6 +1,6 @@
 from app.models import db, Bookmark
 from app.extensions import ma
-from marshmallow import fields
+from marshmallow import Schema, fields, validate
 
 class BookmarkSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
@@ -10,5 +10,15 @@ class BookmarkSchema(ma.SQLAlchemyAutoSchema):
     user_id = fields.Int(load_only=True)
     manga_id = fields.Int(required=True)
         
+class BookmarkLibrarySchema(BookmarkSchema):
+    manga_id = fields.String(required=True)
+        
+class SyncOperationSchema(Schema):
+    op = fields.String(required=True, validate=validate.OneOf(['add', 'remove', 'favorite', 'read']))
+    manga_id = fields.String(required=True)
+    favorited = fields.Boolean()
+    last_read_chapter = fields.String(validate=validate.Length(max=500))
+        
 bookmark_schema = BookmarkSchema()
-bookmarks_schema = BookmarkSchema(many=True)
\ No newline at end of file
+bookmarks_schema = BookmarkSchema(many=True)
+sync_operations_schema = SyncOperationSchema(many=True)
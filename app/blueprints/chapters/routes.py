@@ -1,11 +1,27 @@
-from .schema import chapter_schema, chapters_schema
+from .schema import ChapterSchema, ChapterImportSchema, chapter_schema, chapters_bulk_schema
 from flask import request, jsonify
 from marshmallow import ValidationError
-from sqlalchemy import select, and_
-from app.models import Chapter, db, ReadingHistory
+from sqlalchemy import select, insert, and_, func
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import Chapter, Manga, db, chapter_sort_key
 from . import chapters_bp
+from app.extensions import cached_view, invalidate
+from app.utils.pagination import keyset_paginate, order_by_clauses, keyset_after, InvalidCursor, InvalidPerPage
+from app.utils.conditional import conditional, make_etag
+from app.utils.fields import sparse_fieldset, requested_fields, InvalidFields
+from app.utils.serializers import row_serializer
+from app.utils.navigation import chapter_navigation, chapter_stamp
+from app.utils.trigrams import search_titles, index_titles
+from app.utils.chapter_counts import count_chapters
+from app.utils.history import history_recorder
+from app.utils.latest import latest_chapters
+from app.utils.export import export_catalog, ndjson_response, EXPORT_BATCH_SIZE, MAX_EXPORT_BATCH_SIZE
 from app.utils.util import user_required, admin_required
-from datetime import datetime, timezone
+from datetime import datetime
+import uuid
+
+MAX_PER_PAGE = 100
+MAX_BULK_CHAPTERS = 1000
 
 @chapters_bp.route('/', methods=['POST'])
 @admin_required
@@ -35,25 +51,153 @@ def create_chapter():
         db.session.rollback()
         return jsonify({'message': 'Database error', 'error': str(e)}), 500
     
+    invalidate('chapter:list', f'manga:{chapter_data.manga_id}:chapters')
+    latest_chapters().publish(chapter_data)
     return jsonify({'message': 'New chapter added successfully', 'chapter': chapter_schema.dump(chapter_data)}), 201
 
+@chapters_bp.route('/bulk', methods=['POST'])
+@admin_required
+def create_chapters_bulk():
+    payload = request.json
+    if not isinstance(payload, list) or not payload:
+        return jsonify({'message': 'Expected a non-empty array of chapters'}), 400
+    if len(payload) > MAX_BULK_CHAPTERS:
+        return jsonify({'message': f'At most {MAX_BULK_CHAPTERS} chapters per request'}), 400
+    
+    try:
+        loaded, errors = chapters_bulk_schema.load(payload), {}
+    except ValidationError as e:
+        loaded, errors = e.valid_data, e.messages
+    
+    results = [{'index': i, 'status': 'invalid', 'errors': errors[i]} if i in errors else None for i in range(len(payload))]
+    valid = [(i, loaded[i]) for i in range(len(payload)) if i not in errors]
+    
+    manga_ids = {chapter['manga_id'] for _, chapter in valid}
+    if len(manga_ids) > 1:
+        return jsonify({'message': 'All chapters must belong to the same manga'}), 400
+    
+    rows = []
+    if valid:
+        manga_id = manga_ids.pop()
+        if db.session.get(Manga, manga_id) is None:
+            return jsonify({'message': 'Manga not found'}), 404
+        
+        existing = set(db.session.execute(
+            select(Chapter.chapter_number).where(
+                Chapter.manga_id == manga_id,
+                Chapter.chapter_number.in_({chapter['chapter_number'] for _, chapter in valid})
+            )
+        ).scalars())
+        
+        for i, chapter in valid:
+            if chapter['chapter_number'] in existing:
+                results[i] = {'index': i, 'status': 'duplicate', 'chapter_number': chapter['chapter_number']}
+                continue
+            existing.add(chapter['chapter_number'])
+            row = {
+                'id': str(uuid.uuid4()),
+                'manga_id': manga_id,
+                'chapter_number': chapter['chapter_number'],
+                'title': chapter.get('title'),
+                'release_date': chapter['release_date'],
+                'language': chapter.get('language', 'en'),
+                'sort_key': chapter_sort_key(chapter['chapter_number'])
+            }
+            rows.append(row)
+            results[i] = {'index': i, 'status': 'created', 'id': row['id']}
+    
+    if rows:
+        try:
+            db.session.execute(insert(Chapter).values(rows))
+            index_titles(db.session.connection(), [(row['id'], row['title']) for row in rows], replace=False)
+            count_chapters(db.session.connection(), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': 'Database error', 'error': str(e)}), 500
+        
+        invalidate('chapter:list', 'chapter:latest', f'manga:{manga_id}:chapters')
+    
+    return jsonify({
+        'created': len(rows),
+        'duplicates': sum(result['status'] == 'duplicate' for result in results),
+        'invalid': len(errors),
+        'results': results
+    }), 201 if rows else 200
+
+@chapters_bp.route('/export', methods=['GET'])
+def export_chapters():
+    # exported with a string manga_id so the lines feed straight back into /manga/import
+    try:
+        batch_size = min(int(request.args.get('batch_size', EXPORT_BATCH_SIZE)), MAX_EXPORT_BATCH_SIZE)
+        chunks = export_catalog('chapter', Chapter, ChapterImportSchema, request.args.get('resume_token'), max(batch_size, 1))
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid resume token'}), 400
+    except ValueError:
+        return jsonify({'message': 'batch_size must be an integer'}), 400
+    
+    return ndjson_response(chunks)
+
+@chapters_bp.route('/latest', methods=['GET'])
+def get_latest_chapters():
+    try:
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), MAX_PER_PAGE)
+    except ValueError:
+        return jsonify({'message': 'per_page must be an integer'}), 400
+    
+    try:
+        chapters, next_cursor = latest_chapters().page(per_page, request.args.get('cursor'), request.args.get('language'))
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    
+    # grouped by manga, groups ordered by their newest chapter on this page
+    groups = {}
+    for chapter in chapters:
+        groups.setdefault(chapter['manga_id'], []).append(chapter)
+    
+    return jsonify({
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'manga': [{'manga_id': manga_id, 'chapters': group} for manga_id, group in groups.items()]
+    }), 200
+
 @chapters_bp.route("/", methods=['GET'])
+@cached_view('chapter:list')
 def get_chapter():
     try:
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        serializer = row_serializer(ChapterSchema, requested_fields(ChapterSchema))
+        query = serializer.select(Chapter.id)
+        
+        if 'cursor' in request.args:
+            chapters, next_cursor = keyset_paginate(
+                query, [(Chapter.id, False)], request.args['cursor'], per_page, scalars=False
+            )
+            return jsonify({
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'chapters': serializer.dump(chapters)
+            }), 200
+        
+        page = int(request.args.get('page', 1))
         offset = (page - 1) * per_page
         total_count = db.session.query(Chapter).count()
         
-        query = select(Chapter).offset(offset).limit(per_page)
-        chapters = db.session.execute(query).scalars().all()
+        query = query.order_by(Chapter.id).offset(offset).limit(per_page)
+        chapters = db.session.execute(query).all()
         
         return jsonify({
             'page': page,
             'per_page': per_page,
             'total_chapters': total_count,
-            'chapters': chapters_schema.dump(chapters)
+            'chapters': serializer.dump(chapters)
         }), 200
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'message': 'Error fetching Chapters', 'error': str(e)}), 500
     
@@ -64,55 +208,114 @@ def get_chapter_by_id(id):
     if not chapter:
         return jsonify({'message': 'Chapter not found'}), 404
     
-    user_id = request.user_id
-    
-    if user_id:
-        history = db.session.execute(
-            select(ReadingHistory).where(
-                (ReadingHistory.user_id == user_id) &
-                (ReadingHistory.manga_id == chapter.manga_id)
-            )
-        ).scalar_one_or_none()
-        
-        if not history:
-            history = ReadingHistory(
-                user_id=user_id, 
-                manga_id=chapter.manga_id,
-                last_chapter=chapter.id
-            )
-            db.session.add(history)
-        else:
-            history.last_chapter = chapter.id
-            history.last_read_at = datetime.now(timezone.utc)
-            
-        db.session.commit()
+    if request.user_id:
+        history_recorder().record(request.user_id, chapter.manga_id, chapter.id)
             
     return jsonify(chapter_schema.dump(chapter)), 200
     
-@chapters_bp.route('/manga/<int:manga_id>', methods=['GET'])
+MANGA_CHAPTERS_ORDER = [(Chapter.language, False), (Chapter.sort_key, False), (Chapter.id, False)]
+
+# every listed column lives in ix_chapter_manga_listing, so a default page is read from the index alone
+MANGA_LISTING_FIELDS = ('id', 'manga_id', 'chapter_number', 'language', 'sort_key', 'release_date')
+
+def manga_chapters_validators(manga_id):
+    # built from the rows (index-only on ix_chapter_manga_stamp), so writes from other workers and
+    # CLI commands change it too. Last-Modified misses deletes, which only lower the count; clients
+    # sending If-None-Match are validated on the ETag alone
+    count, last_modified, versions = chapter_stamp(manga_id)
+    if not count:
+        return None
+    etag = make_etag('chapters', manga_id, count, last_modified, versions, request.query_string.decode())
+    return etag, last_modified, f'manga:{manga_id}:chapters'
+
+def parse_release_date(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+@chapters_bp.route('/manga/<string:manga_id>', methods=['GET'])
+@conditional(manga_chapters_validators)
+@cached_view('manga:{manga_id}:chapters')
 def get_chapters_by_manga_id(manga_id):
-    chapters = db.session.execute(
-        select(Chapter).where(Chapter.manga_id == manga_id)
-    ).scalars().all()
-    
-    if not chapters:
-        return jsonify({'message': 'No chapters found for this manga'}), 404
+    try:
+        per_page = min(max(int(request.args.get('per_page', MAX_PER_PAGE)), 1), MAX_PER_PAGE)
+        released_after = parse_release_date('released_after')
+        released_before = parse_release_date('released_before')
+        # ChapterImportSchema dumps manga_id as the uuid string it is; ChapterSchema would coerce it to int
+        serializer = row_serializer(ChapterImportSchema, requested_fields(ChapterImportSchema) or MANGA_LISTING_FIELDS)
+        
+        query = serializer.select(Chapter.language, Chapter.sort_key, Chapter.id).where(Chapter.manga_id == manga_id)
+        if request.args.get('language'):
+            query = query.where(Chapter.language == request.args['language'])
+        if released_after:
+            query = query.where(Chapter.release_date >= released_after)
+        if released_before:
+            query = query.where(Chapter.release_date < released_before)
+        
+        chapters, next_cursor = keyset_paginate(
+            query, MANGA_CHAPTERS_ORDER, request.args.get('cursor'), per_page, scalars=False
+        )
+        if not chapters and not db.session.execute(select(Chapter.id).where(Chapter.manga_id == manga_id).limit(1)).first():
+            return jsonify({'message': 'No chapters found for this manga'}), 404
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    except ValueError:
+        return jsonify({'message': 'per_page must be an integer and release dates ISO 8601'}), 400
     
-    return jsonify(chapters_schema.dump(chapters)), 200
+    return jsonify({
+        'manga_id': manga_id,
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'chapters': serializer.dump(chapters)
+    }), 200
 
 @chapters_bp.route('/search', methods=['GET'])
+@cached_view('chapter:list')
 def search_for_chapter():
-    title = request.args.get('title')
+    title = request.args.get('title', '').strip()
     language = request.args.get('language')
+    manga_id = request.args.get('manga_id')
+    
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 10)), 1), MAX_PER_PAGE)
+        query, schema = sparse_fieldset(select(Chapter), Chapter, ChapterImportSchema, many=True, keep=[Chapter.id])
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except ValueError:
+        return jsonify({'message': 'page and per_page must be integers'}), 400
     
-    query = select(Chapter)
     if title:
-        query = query.where(Chapter.title.ilike(f"%{title}%"))
-    if language:
-        query = query.where(Chapter.language == language)
-        
-    results = db.session.execute(query).scalars().all()
-    return jsonify(chapters_schema.dump(results)), 200
+        total_count, ids = search_titles(title, page, per_page, manga_id=manga_id, language=language)
+        chapters = db.session.execute(query.where(Chapter.id.in_(ids))).scalars().all() if ids else []
+        by_id = {chapter.id: chapter for chapter in chapters}
+        chapters = [by_id[i] for i in ids if i in by_id]
+    else:
+        if manga_id is not None:
+            query = query.where(Chapter.manga_id == manga_id)
+        if language:
+            query = query.where(Chapter.language == language)
+        total_count = db.session.execute(select(func.count()).select_from(query.subquery())).scalar()
+        chapters = db.session.execute(query.order_by(Chapter.id).offset((page - 1) * per_page).limit(per_page)).scalars().all()
+    
+    return jsonify({
+        'query': title,
+        'page': page,
+        'per_page': per_page,
+        'total_results': total_count,
+        'chapters': schema.dump(chapters)
+    }), 200
+
+def adjacent_chapter(chapter, previous=False):
+    # one range scan on ix_chapter_manga_listing; id breaks ties between equal sort keys
+    order = [(Chapter.sort_key, previous), (Chapter.id, previous)]
+    query = select(Chapter).where(
+        Chapter.manga_id == chapter.manga_id,
+        Chapter.language == chapter.language,
+        keyset_after(order, [chapter.sort_key, chapter.id])
+    ).order_by(*order_by_clauses(order)).limit(1)
+    return db.session.execute(query).scalars().first()
 
 @chapters_bp.route('/<string:id>/next', methods=['GET'])
 def get_next_chapter(id):
@@ -120,13 +323,34 @@ def get_next_chapter(id):
     if not chapter:
         return jsonify({'message': 'Chapter not found'}), 404
     
-    next_chapter = db.session.execute(select(Chapter).where(Chapter.manga_id == chapter.manga_id, Chapter.release_date > chapter.release_date).order_by(Chapter.release_date.asc())).scalars().first()
+    next_chapter = adjacent_chapter(chapter)
     
     if not next_chapter:
         return jsonify({'message': 'No next chapter'})
     
     return jsonify(chapter_schema.dump(next_chapter)), 200
 
+@chapters_bp.route('/<string:id>/previous', methods=['GET'])
+def get_previous_chapter(id):
+    chapter = db.session.get(Chapter, id)
+    if not chapter:
+        return jsonify({'message': 'Chapter not found'}), 404
+    
+    previous_chapter = adjacent_chapter(chapter, previous=True)
+    
+    if not previous_chapter:
+        return jsonify({'message': 'No previous chapter'})
+    
+    return jsonify(chapter_schema.dump(previous_chapter)), 200
+
+@chapters_bp.route('/<string:id>/nav', methods=['GET'])
+def get_chapter_nav(id):
+    nav = chapter_navigation().nav(id)
+    if nav is None:
+        return jsonify({'message': 'Chapter not found'}), 404
+    
+    return jsonify(nav), 200
+
 @chapters_bp.route('/<string:id>', methods=['PUT'])
 @admin_required
 def update_chapter_by_id(id):
@@ -135,12 +359,20 @@ def update_chapter_by_id(id):
     if not chapter:
         return jsonify({'message': 'Chapter not found'}), 404
     
+    previous_manga_id = chapter.manga_id
+    
     try:
         chapter = chapter_schema.load(request.json, instance=chapter)
     except ValidationError as e:
         return jsonify({'message': 'Validation error', 'errors': e.messages}), 400
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # version_id_col: someone else updated the chapter since it was loaded
+        db.session.rollback()
+        return jsonify({'message': 'Chapter was modified concurrently; fetch it again'}), 409
+    invalidate('chapter:list', 'chapter:latest', f'manga:{previous_manga_id}:chapters', f'manga:{chapter.manga_id}:chapters')
     return jsonify(chapter_schema.dump(chapter)), 200
 
 @chapters_bp.route('/<string:id>', methods=['DELETE'])
@@ -151,6 +383,8 @@ def delete_chapter(id):
     if not chapter:
         return jsonify({'message': 'Chapter not found'}), 404
     
+    manga_id = chapter.manga_id
     db.session.delete(chapter)
     db.session.commit()
+    invalidate('chapter:list', 'chapter:latest', f'manga:{manga_id}:chapters')
     return jsonify({'message': f'successfully deleted chapter {id}'}), 200
\ No newline at end of file
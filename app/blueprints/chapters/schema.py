@@ -8,6 +8,13 @@ class ChapterSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         
     manga_id = fields.Integer(required=True)
+    sort_key = fields.Float(dump_only=True)
+    version = fields.Int(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+        
+class ChapterImportSchema(ChapterSchema):
+    manga_id = fields.String(required=True)
         
 chapter_schema = ChapterSchema()
-chapters_schema = ChapterSchema(many=True)
\ No newline at end of file
+chapters_schema = ChapterSchema(many=True)
+chapters_bulk_schema = ChapterImportSchema(many=True, load_instance=False)
\ No newline at end of file
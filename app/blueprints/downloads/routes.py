@@ -1,9 +1,16 @@
 from .schema import download_schema, downloads_schema
+import re
+from datetime import datetime, timedelta, timezone
 from flask import request, jsonify
 from marshmallow import ValidationError
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from app.models import Download, db
 from . import downloads_bp
+from app.utils.pagination import keyset_paginate, InvalidCursor, InvalidPerPage
+from app.utils.download_filter import download_filter
+from app.utils.download_counts import count_downloads, top_downloads
+from app.utils.upsert import upsert
 from app.utils.util import user_required, admin_required
 
 @downloads_bp.route('/', methods=['POST'])
@@ -16,34 +23,58 @@ def create_download():
     except ValidationError as e:
         return jsonify({'message': 'Validation error', 'errors': e.messages}), 400
     
-    already_downloaded = db.session.execute(
-        select(Download).where(
-            (Download.chapter_id == download_data.chapter_id) &
-            (Download.user_id == request.user_id)
-        )
-    ).scalar_one_or_none()
-    
-    if already_downloaded:
+    downloads = download_filter()
+    if downloads.contains(request.user_id, download_data.chapter_id):
         return jsonify({
             'status': 'fail',
             'message': 'Already downloaded'
         }), 409
-        
+    
+    row = {'user_id': request.user_id, 'chapter_id': download_data.chapter_id}
+    if download_data.downloaded_at:
+        row['downloaded_at'] = download_data.downloaded_at
+    
     try:
-        db.session.add(download_data)
+        result = upsert(db.session, Download.__table__, row, ['user_id', 'chapter_id'])
+        if not result.inserted:
+            db.session.rollback()
+            downloads.add(request.user_id, download_data.chapter_id)
+            return jsonify({
+                'status': 'fail',
+                'message': 'Already downloaded'
+            }), 409
+        count_downloads(db.session, [row])
         db.session.commit()
+        downloads.add(request.user_id, download_data.chapter_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Database error', 'error': str(e)}), 500
     
+    download_data = db.session.execute(
+        select(Download).where(
+            (Download.chapter_id == download_data.chapter_id) &
+            (Download.user_id == request.user_id)
+        )
+    ).scalar_one()
     return jsonify({'message': 'Downloaded successfully', 'download': download_schema.dump(download_data)}), 201
 
 @downloads_bp.route('/', methods=['GET'])
 @admin_required
 def get_all_downloaded():
     try:
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        
+        if 'cursor' in request.args:
+            downloads, next_cursor = keyset_paginate(
+                select(Download), [(Download.id, False)], request.args['cursor'], per_page
+            )
+            return jsonify({
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'downloads': downloads_schema.dump(downloads)
+            }), 200
+        
+        page = int(request.args.get('page', 1))
         offset = (page - 1) * per_page
         total_count = db.session.query(Download).count()
         
@@ -56,9 +87,42 @@ def get_all_downloaded():
             'total_downloads': total_count,
             'downloads': downloads_schema.dump(downloads)
         }), 200
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'message': 'Error fetching downloads', 'error': str(e)}), 500
     
+MAX_TOP_LIMIT = 100
+
+@downloads_bp.route('/stats/top', methods=['GET'])
+@admin_required
+def get_top_downloads():
+    by = request.args.get('by', 'chapter')
+    window = request.args.get('window', '7d')
+    if by not in ('chapter', 'manga'):
+        return jsonify({'message': 'by must be chapter or manga'}), 400
+    
+    match = re.fullmatch(r'(\d+)d', window)
+    if window != 'all' and not (match and 0 < int(match.group(1)) <= 366):
+        return jsonify({'message': "window must be 'all' or a number of days such as 7d (at most 366d)"}), 400
+    # counters are bucketed by UTC day; a 7d window is today plus the six days before it
+    since = datetime.now(timezone.utc).date() - timedelta(days=int(match.group(1)) - 1) if match else None
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), MAX_TOP_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    
+    top = top_downloads(by, since, limit)
+    return jsonify({
+        'by': by,
+        'window': window,
+        'since': since.isoformat() if since else None,
+        'top': [{f'{by}_id': id, 'downloads': total} for total, id in top]
+    }), 200
+
 @downloads_bp.route('/<int:id>', methods=['PUT'])
 @user_required
 def update_download(id):
@@ -76,7 +140,17 @@ def update_download(id):
     except ValidationError as e:
         return jsonify({e.messages}), 400
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the unique (user_id, chapter_id) index: the new chapter is already downloaded
+        db.session.rollback()
+        return jsonify({
+            'status': 'fail',
+            'message': 'Already downloaded'
+        }), 409
+    # the chapter it pointed at before is no longer downloaded
+    download_filter().removed(request.user_id)
     return jsonify(download_schema.dump(download)), 200
 
 @downloads_bp.route('/<int:id>', methods=['DELETE'])
@@ -92,4 +166,5 @@ def delete_download(id):
     
     db.session.delete(download)
     db.session.commit()
+    download_filter().removed(request.user_id)
     return jsonify({'message': f'successfully deleted download {id}'})
\ No newline at end of file
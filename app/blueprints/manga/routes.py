@@ -1,10 +1,32 @@
-from .schema import manga_schema, mangas_schema
-from flask import request, jsonify
+from .schema import MangaSchema, manga_schema
+from flask import request, jsonify, json
 from marshmallow import ValidationError
-from sqlalchemy import select
+from sqlalchemy import select, func
+from sqlalchemy.orm.exc import StaleDataError
 from app.models import Manga, db
 from . import manga_bp
+from app.extensions import cached_view, invalidate
+from app.utils.pagination import keyset_paginate, parse_sort, order_by_clauses, InvalidCursor, InvalidSort, InvalidPerPage
+from app.utils.search import manga_index, index_manga, unindex_manga
+from app.utils.genres import sync_genres, filter_by_genres, genre_facets
+from app.utils.conditional import conditional, make_etag
+from app.utils.fields import sparse_fieldset, requested_fields, InvalidFields
+from app.utils.serializers import row_serializer
 from app.utils.util import user_required, admin_required
+from app.utils.catalog import import_catalog, CHUNK_SIZE
+from app.utils.export import export_catalog, ndjson_response, EXPORT_BATCH_SIZE, MAX_EXPORT_BATCH_SIZE
+
+SORTABLE_COLUMNS = {
+    'views': Manga.views,
+    'rating': Manga.rating,
+    'published_date': Manga.published_date,
+    'title': Manga.title
+}
+
+def manga_order(sort):
+    if not sort:
+        return [(Manga.id, False)]
+    return parse_sort(sort, SORTABLE_COLUMNS, Manga.id)
 
 @manga_bp.route("/", methods=['POST'])
 @admin_required
@@ -23,43 +45,154 @@ def create_manga():
         }), 409
         
     try:
+        sync_genres(manga_data)
         db.session.add(manga_data)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Database error', 'error': str(e)}), 500
     
+    index_manga(manga_data)
+    invalidate('manga:list')
     return jsonify({'message': 'New manga added successfully', 'manga': manga_schema.dump(manga_data)}), 201
 
+@manga_bp.route('/import', methods=['POST'])
+@admin_required
+def import_mangas():
+    try:
+        skip = int(request.args.get('skip', 0))
+        chunk_size = int(request.args.get('chunk_size', CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'message': 'skip and chunk_size must be integers'}), 400
+    
+    if chunk_size < 1:
+        return jsonify({'message': 'chunk_size must be positive'}), 400
+    
+    # one progress line per committed chunk; a client that loses the connection resumes with ?skip=<last_line>
+    def generate():
+        for report in import_catalog(request.stream, chunk_size=chunk_size, skip=skip):
+            yield json.dumps(report) + '\n'
+    
+    return ndjson_response(generate())
+
+@manga_bp.route('/export', methods=['GET'])
+def export_mangas():
+    try:
+        batch_size = min(int(request.args.get('batch_size', EXPORT_BATCH_SIZE)), MAX_EXPORT_BATCH_SIZE)
+        chunks = export_catalog('manga', Manga, MangaSchema, request.args.get('resume_token'), max(batch_size, 1))
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid resume token'}), 400
+    except ValueError:
+        return jsonify({'message': 'batch_size must be an integer'}), 400
+    
+    return ndjson_response(chunks)
+
 @manga_bp.route('/', methods=['GET'])
+@cached_view('manga:list')
 def get_mangas():
     try:
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 100))
+        order = manga_order(request.args.get('sort'))
+        serializer = row_serializer(MangaSchema, requested_fields(MangaSchema))
+        query = filter_by_genres(
+            serializer.select(*[c for c, _ in order]),
+            request.args.getlist('genre'),
+            match_all=request.args.get('genre_mode', 'all') != 'any'
+        )
+        
+        if 'cursor' in request.args:
+            mangas, next_cursor = keyset_paginate(
+                query, order, request.args['cursor'], per_page, scalars=False
+            )
+            return jsonify({
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'mangas': serializer.dump(mangas)
+            }), 200
+        
+        page = int(request.args.get('page', 1))
         offset = (page - 1) * per_page
-        total_count = db.session.query(Manga).count()
+        total_count = db.session.execute(select(func.count()).select_from(query.subquery())).scalar()
         
-        query = select(Manga).offset(offset).limit(per_page)
-        mangas = db.session.execute(query).scalars().all()
+        query = query.order_by(*order_by_clauses(order)).offset(offset).limit(per_page)
+        mangas = db.session.execute(query).all()
         
         return jsonify({
             'page': page,
             'per_page': per_page,
             'total_mangas': total_count,
-            'mangas': mangas_schema.dump(mangas)
+            'mangas': serializer.dump(mangas)
         }), 200
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    except InvalidSort:
+        return jsonify({'message': f"Invalid sort, expected one of: {', '.join(SORTABLE_COLUMNS)} (prefix with - for descending)"}), 400
     except Exception as e:
         return jsonify({'message': 'Error fetching Mangas', 'error': str(e)}), 500
     
+@manga_bp.route('/genres', methods=['GET'])
+@cached_view('manga:list')
+def get_genre_facets():
+    genres = genre_facets(
+        request.args.getlist('genre'),
+        match_all=request.args.get('genre_mode', 'all') != 'any'
+    )
+    return jsonify({'genres': genres}), 200
+
+@manga_bp.route('/search', methods=['GET'])
+@cached_view('manga:list')
+def search_mangas():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'message': 'Query parameter q is required'}), 400
+    
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 10))
+        query, schema = sparse_fieldset(select(Manga), Manga, MangaSchema, many=True, keep=[Manga.id])
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    except ValueError:
+        return jsonify({'message': 'page and per_page must be integers'}), 400
+    
+    total_count, ids = manga_index().search(q, offset=(page - 1) * per_page, limit=per_page)
+    
+    mangas = db.session.execute(query.where(Manga.id.in_(ids))).scalars().all() if ids else []
+    by_id = {manga.id: manga for manga in mangas}
+    
+    return jsonify({
+        'query': q,
+        'page': page,
+        'per_page': per_page,
+        'total_results': total_count,
+        'mangas': schema.dump([by_id[i] for i in ids if i in by_id])
+    }), 200
+    
+def manga_validators(id):
+    row = db.session.execute(select(Manga.version, Manga.updated_at).where(Manga.id == id)).one_or_none()
+    if row is None:
+        return None
+    return make_etag('manga', id, row.version), row.updated_at, f'manga:{id}'
+
 @manga_bp.route('/<string:id>', methods=['GET'])
+@conditional(manga_validators)
+@cached_view('manga:{id}')
 def get_manga_by_id(id):
-    query = select(Manga).where(Manga.id == id)
+    try:
+        query, schema = sparse_fieldset(select(Manga).where(Manga.id == id), Manga, MangaSchema)
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+    
     result = db.session.execute(query).scalars().first()
     
     if result is None:
         return jsonify({'message': 'Manga is not found'}), 404
     
-    return jsonify(manga_schema.dump(result)), 200
+    return jsonify(schema.dump(result)), 200
 
 @manga_bp.route('/<string:id>', methods=['PUT'])
 @admin_required
@@ -74,7 +207,16 @@ def update_manga(id):
     except ValidationError as e:
         return jsonify(e.messages), 400
     
-    db.session.commit()
+    try:
+        if 'genre' in request.json:
+            sync_genres(manga)
+        db.session.commit()
+    except StaleDataError:
+        # version_id_col: someone else updated the manga since it was loaded
+        db.session.rollback()
+        return jsonify({'message': 'Manga was modified concurrently; fetch it again'}), 409
+    index_manga(manga)
+    invalidate(f'manga:{id}', 'manga:list')
     return manga_schema.jsonify(manga), 200
 
 @manga_bp.route('/<string:id>', methods=['DELETE'])
@@ -87,4 +229,6 @@ def delete_manga(id):
     
     db.session.delete(manga)
     db.session.commit()
+    unindex_manga(id)
+    invalidate(f'manga:{id}', f'manga:{id}:chapters', 'manga:list')
     return jsonify({'message': f"Successfully deleted manga {id}"}), 200
\ No newline at end of file
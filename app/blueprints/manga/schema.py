@@ -1,10 +1,14 @@
 from app.models import db, Manga
 from app.extensions import ma
+from marshmallow import fields
 
 class MangaSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Manga
         load_instance = True
         
+    version = fields.Int(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+        
 manga_schema = MangaSchema()
 mangas_schema = MangaSchema(many=True)
\ No newline at end of file
@@ -1,42 +1,45 @@
-from .schema import reading_histories_schema, reading_history_schema
+from .schema import ReadingHistorySchema, reading_history_schema
 from flask import request, jsonify
 from marshmallow import ValidationError
 from sqlalchemy import select
-from app.models import ReadingHistory, db
+from app.models import ReadingHistory, db, daily_manga_reads, daily_user_reads
 from . import reading_history_bp
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from app.utils.export import json_array_response
+from app.utils.serializers import row_serializer
+from app.utils.upsert import upsert
 from app.utils.util import user_required, admin_required
 
 @reading_history_bp.route('/', methods=['GET'])
 @admin_required
 def get_reading_history():
-    query = select(ReadingHistory)
-    reading_history = db.session.execute(query).scalars().all()
+    serializer = row_serializer(ReadingHistorySchema)
+    query = serializer.select().order_by(ReadingHistory.id)
     
-    return jsonify({'reading_history': reading_histories_schema.dump(reading_history)}), 200
+    return json_array_response(query, serializer.dump, 'reading_history')
 
 @reading_history_bp.route('/admin/user/<string:user_id>', methods=['GET'])
 @admin_required
 def get_user_reading_history_admin(user_id):
-    query = select(ReadingHistory).where(ReadingHistory.user_id == user_id)
-    reading_history = db.session.execute(query).scalars().all()
+    serializer = row_serializer(ReadingHistorySchema)
+    query = serializer.select().where(ReadingHistory.user_id == user_id).order_by(ReadingHistory.id)
     
-    return jsonify({'reading_history': reading_histories_schema.dump(reading_history)}), 200
+    return json_array_response(query, serializer.dump, 'reading_history')
 
 @reading_history_bp.route('/user', methods=['GET'])
 @user_required
 def get_reading_history_for_user():
     user_id = request.user_id
     
-    query = select(ReadingHistory).where(ReadingHistory.user_id == user_id)
-    reading_history = db.session.execute(query).scalars().all()
+    serializer = row_serializer(ReadingHistorySchema)
+    query = serializer.select().where(ReadingHistory.user_id == user_id).order_by(ReadingHistory.id)
     
-    return jsonify({'reading_history': reading_histories_schema.dump(reading_history)}), 200
+    return json_array_response(query, serializer.dump, 'reading_history')
 
 @reading_history_bp.route('/user/<string:user_id>', methods=['PUT'])
 @user_required
 def update_reading_history(user_id):
-    if request.user_id != user_id:
+    if str(request.user_id) != user_id:
         return jsonify({'message': 'Unauthorized'}), 403
     
     data = request.get_json()
@@ -46,20 +49,12 @@ def update_reading_history(user_id):
     if not manga_id or not last_chapter:
         return jsonify({'message': 'manga_id and last chapter are required'}), 400
     
-    history = db.session.execute(
-        select(ReadingHistory).where(
-            (ReadingHistory.user_id == user_id)&
-            (ReadingHistory.manga_id == manga_id)
-        )
-    ).scalar_one_or_none()
-    
-    if not history:
-        return jsonify({'message': 'Reading history not found'}), 404
-    
-    history.last_chapter = last_chapter
-    history.last_read_at = datetime.utcnow()
+    history = {'user_id': request.user_id, 'manga_id': manga_id, 'last_chapter': last_chapter, 'last_read_at': datetime.utcnow()}
+    result = upsert(db.session, ReadingHistory.__table__, history, ['user_id', 'manga_id'], update=['last_chapter', 'last_read_at'])
     db.session.commit()
     
+    if result.inserted:
+        return jsonify({'message': 'Reading history created', 'reading history': reading_history_schema.dump(history)}), 201
     return jsonify({'message': 'Reading history updated', 'reading history': reading_history_schema.dump(history)}), 200
 
 @reading_history_bp.route('/admin/user/<string:user_id>', methods=['DELETE'])
@@ -78,6 +73,40 @@ def delete_user_history_admin(user_id):
     db.session.commit()
     return jsonify({'message': f"Deleted reading history for user {user_id}"}), 200
 
+ANALYTICS_DEFAULT_DAYS = 30
+
+def daily_reads(table, key):
+    # rollup tables only; raw reading_event rows are never scanned here
+    end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+    start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    
+    query = select(table.c.day, table.c[key], table.c.reads).where(table.c.day.between(start, end))
+    if request.args.get(key):
+        query = query.where(table.c[key] == request.args[key])
+    rows = db.session.execute(query.order_by(table.c.day, table.c[key])).all()
+    
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_reads': sum(row.reads for row in rows),
+        'daily': [{'day': row.day.isoformat(), key: row[1], 'reads': row.reads} for row in rows]
+    }), 200
+
+@reading_history_bp.route('/admin/analytics/manga', methods=['GET'])
+@admin_required
+def get_daily_manga_reads():
+    try:
+        return daily_reads(daily_manga_reads, 'manga_id')
+    except ValueError:
+        return jsonify({'message': 'start and end must be ISO dates'}), 400
+
+@reading_history_bp.route('/admin/analytics/users', methods=['GET'])
+@admin_required
+def get_daily_user_reads():
+    try:
+        return daily_reads(daily_user_reads, 'user_id')
+    except ValueError:
+        return jsonify({'message': 'start and end must be ISO dates'}), 400
 
 @reading_history_bp.route('/user/<string:id>', methods=['DELETE'])
 @user_required
@@ -5,6 +5,7 @@ from sqlalchemy import select
 from app.models import User, db
 from . import users_bp
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.pagination import keyset_paginate, InvalidCursor, InvalidPerPage
 from app.utils.util import encode_token, user_required, admin_required
 
 @users_bp.route("/login", methods=['POST'])
@@ -89,8 +90,19 @@ def create_user():
 @admin_required
 def get_users():
     try:
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        
+        if 'cursor' in request.args:
+            users, next_cursor = keyset_paginate(
+                select(User), [(User.id, False)], request.args['cursor'], per_page
+            )
+            return jsonify({
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'users': users_schema.dump(users)
+            }), 200
+        
+        page = int(request.args.get('page', 1))
         offset = (page - 1) * per_page
         total_count = db.session.query(User).count()
         
@@ -103,6 +115,10 @@ def get_users():
             'total_users': total_count,
             'users': users_schema.dump(users)
         }), 200
+    except InvalidPerPage:
+        return jsonify({'message': 'per_page must be at least 1'}), 400
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'message': 'Error fetching Users', 'error': str(e)}), 500
     
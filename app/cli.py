@@ -0,0 +1,227 @@
+import click
+from datetime import datetime, timezone
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, update, delete, inspect, text, bindparam, func, and_
+from sqlalchemy.schema import CreateColumn
+from app.models import db, Manga, Chapter, Download, manga_genre, chapter_sort_key
+from app.utils.genres import split_genres, resolve_genres
+from app.utils.catalog import import_catalog, CHUNK_SIZE
+from app.utils.trigrams import index_titles
+from app.utils.chapter_counts import rebuild_counts
+from app.utils.download_counts import rebuild_download_counts
+from app.utils.analytics import roll_up_events, prune_events, ROLLUP_BATCH_SIZE, ROLLUP_LAG, PRUNE_CHUNK_SIZE
+
+@click.command('migrate-genres', help='Split Manga.genre strings into the genre and manga_genre tables.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@with_appcontext
+def migrate_genres_command(chunk_size):
+    db.create_all()
+
+    genre_ids = {}
+    last_id = None
+    migrated = 0
+
+    while True:
+        query = select(Manga.id, Manga.genre).order_by(Manga.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(Manga.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        links = []
+        for manga_id, genre in rows:
+            names = split_genres(genre)
+            missing = [name for name in names if name.lower() not in genre_ids]
+            if missing:
+                genres = resolve_genres(missing)
+                db.session.flush()
+                genre_ids.update((genre.name.lower(), genre.id) for genre in genres)
+            links.extend({'manga_id': manga_id, 'genre_id': genre_ids[name.lower()]} for name in names)
+
+        manga_ids = [manga_id for manga_id, _ in rows]
+        db.session.execute(delete(manga_genre).where(manga_genre.c.manga_id.in_(manga_ids)))
+        if links:
+            db.session.execute(insert(manga_genre), links)
+        db.session.commit()
+
+        migrated += len(rows)
+        last_id = rows[-1].id
+        click.echo(f"Migrated genres for {migrated} manga")
+
+@click.command('upgrade-schema', help='Create missing tables, columns and indexes for the current models.')
+@with_appcontext
+def upgrade_schema_command():
+    db.create_all()
+    inspector = inspect(db.engine)
+
+    with db.engine.begin() as conn:
+        preparer = conn.dialect.identifier_preparer
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+                    click.echo(f"Added column {table.name}.{column.name}")
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    click.echo(f"Created index {index.name}")
+
+@click.command('backfill-sort-keys', help='Compute Chapter.sort_key from chapter_number for existing chapters.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@click.option('--all', 'recompute_all', is_flag=True, help='Recompute every chapter, not only those without a sort key.')
+@with_appcontext
+def backfill_sort_keys_command(chunk_size, recompute_all):
+    chapters = Chapter.__table__
+    # plain Core update so the backfill doesn't bump version; updated_at still moves on rows whose key
+    # changes, so listing validators and chapter navigation see the new order
+    statement = (
+        update(chapters)
+        .where(chapters.c.id == bindparam('chapter_id'), chapters.c.sort_key.is_distinct_from(bindparam('key')))
+        .values(sort_key=bindparam('key'), updated_at=bindparam('now'))
+    )
+
+    last_id = None
+    backfilled = 0
+
+    while True:
+        query = select(chapters.c.id, chapters.c.chapter_number).order_by(chapters.c.id).limit(chunk_size)
+        if not recompute_all:
+            query = query.where(chapters.c.sort_key.is_(None))
+        if last_id is not None:
+            query = query.where(chapters.c.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        now = datetime.now(timezone.utc)
+        db.session.execute(statement, [{'chapter_id': row.id, 'key': chapter_sort_key(row.chapter_number), 'now': now} for row in rows])
+        db.session.commit()
+
+        backfilled += len(rows)
+        last_id = rows[-1].id
+        click.echo(f"Backfilled sort keys for {backfilled} chapters")
+
+@click.command('rebuild-chapter-trigrams', help='Rebuild the chapter title trigram index from the chapter table.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@with_appcontext
+def rebuild_chapter_trigrams_command(chunk_size):
+    db.create_all()
+
+    last_id = None
+    indexed = 0
+
+    while True:
+        query = select(Chapter.id, Chapter.title).order_by(Chapter.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(Chapter.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        index_titles(db.session.connection(), rows)
+        db.session.commit()
+
+        indexed += len(rows)
+        last_id = rows[-1].id
+        click.echo(f"Indexed titles for {indexed} chapters")
+
+@click.command('rebuild-chapter-counts', help='Recompute the per-manga, per-language chapter counters.')
+@with_appcontext
+def rebuild_chapter_counts_command():
+    db.create_all()
+    rebuild_counts(db.session.connection())
+    db.session.commit()
+    click.echo("Rebuilt chapter counts")
+
+@click.command('rebuild-download-counts', help='Recompute the daily chapter and manga download counters from the download table.')
+@with_appcontext
+def rebuild_download_counts_command():
+    db.create_all()
+    rebuild_download_counts(db.session.connection())
+    db.session.commit()
+    click.echo("Rebuilt download counts")
+
+@click.command('import-catalog', help='Stream an NDJSON catalog of manga and chapter records into the database.')
+@click.argument('file', type=click.File('r'))
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+@click.option('--skip', default=0, show_default=True, help='Resume after this line number.')
+@with_appcontext
+def import_catalog_command(file, chunk_size, skip):
+    totals = {'manga_inserted': 0, 'chapters_inserted': 0, 'duplicates': 0, 'invalid': 0}
+
+    for report in import_catalog(file, chunk_size=chunk_size, skip=skip):
+        for key in totals:
+            totals[key] += len(report[key]) if key == 'invalid' else report[key]
+        for problem in report['invalid']:
+            click.echo(f"Line {problem['line']}: {problem['errors']}", err=True)
+        click.echo(
+            f"Lines {report['first_line']}-{report['last_line']}: {report['manga_inserted']} manga, "
+            f"{report['chapters_inserted']} chapters, {report['duplicates']} duplicates, {len(report['invalid'])} invalid"
+        )
+
+    click.echo(
+        f"Imported {totals['manga_inserted']} manga and {totals['chapters_inserted']} chapters "
+        f"({totals['duplicates']} duplicates, {totals['invalid']} invalid)"
+    )
+
+@click.command('rollup-reading-events', help='Fold new reading events into the daily read count tables.')
+@click.option('--batch-size', default=ROLLUP_BATCH_SIZE, show_default=True)
+@click.option('--lag', type=float, default=None, help='Seconds an event must have been recorded before it is folded in [default: READING_EVENT_ROLLUP_LAG]')
+@with_appcontext
+def rollup_reading_events_command(batch_size, lag):
+    lag = lag if lag is not None else current_app.config.get('READING_EVENT_ROLLUP_LAG', ROLLUP_LAG)
+    total = 0
+    for folded in roll_up_events(batch_size=batch_size, lag=lag):
+        total += folded
+        click.echo(f"Rolled up {folded} events")
+    click.echo(f"Rolled up {total} reading events")
+
+@click.command('prune-reading-events', help='Delete rolled-up reading events older than the retention window.')
+@click.option('--days', type=int, default=None, help='Retention in days [default: READING_EVENT_RETENTION_DAYS]')
+@click.option('--chunk-size', default=PRUNE_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def prune_reading_events_command(days, chunk_size):
+    days = days if days is not None else current_app.config.get('READING_EVENT_RETENTION_DAYS', 90)
+    total = 0
+    for deleted in prune_events(days, chunk_size=chunk_size):
+        total += deleted
+        click.echo(f"Deleted {deleted} events")
+    click.echo(f"Pruned {total} reading events older than {days} days")
+
+@click.command('dedupe-downloads', help='Keep only the first download per (user, chapter); run before upgrade-schema adds the unique index.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@with_appcontext
+def dedupe_downloads_command(chunk_size):
+    first = (
+        select(Download.user_id, Download.chapter_id, func.min(Download.id).label('id'))
+        .group_by(Download.user_id, Download.chapter_id)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    duplicates = db.session.execute(
+        select(Download.id).join(first, and_(Download.user_id == first.c.user_id, Download.chapter_id == first.c.chapter_id))
+        .where(Download.id != first.c.id)
+    ).scalars().all()
+
+    for start in range(0, len(duplicates), chunk_size):
+        db.session.execute(delete(Download).where(Download.id.in_(duplicates[start:start + chunk_size])))
+        db.session.commit()
+    click.echo(f"Deleted {len(duplicates)} duplicate downloads")
+
+def register_commands(app):
+    app.cli.add_command(migrate_genres_command)
+    app.cli.add_command(upgrade_schema_command)
+    app.cli.add_command(backfill_sort_keys_command)
+    app.cli.add_command(rebuild_chapter_trigrams_command)
+    app.cli.add_command(rebuild_chapter_counts_command)
+    app.cli.add_command(import_catalog_command)
+    app.cli.add_command(rollup_reading_events_command)
+    app.cli.add_command(prune_reading_events_command)
+    app.cli.add_command(dedupe_downloads_command)
+    app.cli.add_command(rebuild_download_counts_command)
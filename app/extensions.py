@@ -1,3 +1,68 @@
+from flask import request, current_app, g
 from flask_marshmallow import Marshmallow
+from flask_caching import Cache
+from functools import wraps
+from urllib.parse import urlencode
+import uuid
 
-ma = Marshmallow()
\ No newline at end of file
+ma = Marshmallow()
+cache = Cache()
+
+# Cached responses are keyed by route, normalized query args and the current version token of every
+# tag they depend on. Invalidating a tag drops its token, so every entry built against it becomes
+# unreachable at once and simply ages out; entries under other tags are untouched. Tokens are random
+# rather than counters so an evicted token can never bring an old entry back.
+#
+# Tokens expire with CACHE_DEFAULT_TIMEOUT like any other entry. With a per-process cache an
+# invalidation never reaches other workers or a CLI run, so the expiry is what bounds how long they
+# keep serving, or building in-process caches on, data written elsewhere.
+
+def _tag_key(tag):
+    return f"tag:{tag}"
+
+def _tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = list(cache.get_many(*keys)) if keys else []
+
+    for i, version in enumerate(versions):
+        if version is None:
+            token = uuid.uuid4().hex
+            cache.add(keys[i], token)
+            versions[i] = cache.get(keys[i]) or token
+
+    return versions
+
+def tag_version(tag):
+    # lets in-process caches check whether their copy still matches the data behind a tag
+    return _tag_versions([tag])[0]
+
+def _view_cache_key(tags):
+    args = sorted((key, value) for key in request.args for value in request.args.getlist(key))
+    versions = '.'.join(_tag_versions(tags))
+    # under @conditional the validator joins the key, so a write the tags missed still misses the cache
+    return f"view:{request.path}?{urlencode(args)}#{versions}#{g.get('validator', '')}"
+
+def cached_view(*tags, timeout=None):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = _view_cache_key([tag.format(**kwargs) for tag in tags])
+
+            hit = cache.get(key)
+            if hit is not None:
+                body, status, mimetype = hit
+                return current_app.response_class(body, status=status, mimetype=mimetype)
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                cache.set(key, (response.get_data(), response.status_code, response.mimetype), timeout=timeout)
+            return response
+
+        return decorated
+
+    return decorator
+
+def invalidate(*tags):
+    # delete_many stops at the first missing key unless CACHE_IGNORE_ERRORS is set
+    for tag in tags:
+        cache.delete(_tag_key(tag))
@@ -1,7 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from datetime import date, datetime, timezone
-from typing import List
+from typing import List, Optional
+import re
 import uuid
 
 class Base(DeclarativeBase):
@@ -9,8 +12,83 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+manga_genre = db.Table(
+    'manga_genre',
+    db.Column('manga_id', db.ForeignKey('manga.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_manga_genre_genre_id_manga_id', 'genre_id', 'manga_id'),
+)
+
+# chapter title search postings, maintained by app.utils.trigrams
+chapter_trigram = db.Table(
+    'chapter_trigram',
+    # binary on MySQL: its default collation would fold accents and case, so two trigrams of the same
+    # title could collide on the primary key
+    db.Column('trigram', db.String(3).with_variant(mysql.VARCHAR(3, collation='utf8mb4_bin'), 'mysql'), primary_key=True),
+    db.Column('chapter_id', db.ForeignKey('chapter.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_chapter_trigram_chapter_id', 'chapter_id'),
+)
+
+# chapters per (manga, language), maintained by app.utils.chapter_counts
+manga_chapter_count = db.Table(
+    'manga_chapter_count',
+    db.Column('manga_id', db.ForeignKey('manga.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('language', db.String(50), primary_key=True),
+    db.Column('chapter_count', db.Integer, nullable=False, default=0),
+)
+
+# per-day read counts folded from reading_event by app.utils.analytics
+daily_manga_reads = db.Table(
+    'daily_manga_reads',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('manga_id', db.String(64), primary_key=True),
+    db.Column('reads', db.Integer, nullable=False, default=0),
+)
+
+daily_user_reads = db.Table(
+    'daily_user_reads',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('user_id', db.Integer, primary_key=True),
+    db.Column('reads', db.Integer, nullable=False, default=0),
+)
+
+# downloads per day, maintained by app.utils.download_counts
+daily_chapter_downloads = db.Table(
+    'daily_chapter_downloads',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('chapter_id', db.String(500), primary_key=True),
+    db.Column('downloads', db.Integer, nullable=False, default=0),
+)
+
+daily_manga_downloads = db.Table(
+    'daily_manga_downloads',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('manga_id', db.String(64), primary_key=True),
+    db.Column('downloads', db.Integer, nullable=False, default=0),
+)
+
+# last reading_event id each rollup has folded in
+rollup_watermark = db.Table(
+    'rollup_watermark',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('last_id', db.Integer, nullable=False, default=0),
+)
+
+class Genre(Base):
+    __tablename__ = 'genre'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # case-insensitive on SQLite as well, matching MySQL's default collation
+    name: Mapped[str] = mapped_column(db.String(100).with_variant(sqlite.VARCHAR(100, collation='NOCASE'), 'sqlite'), nullable=False, unique=True)
+
 class Manga(Base):
     __tablename__ = 'manga'
+    __table_args__ = (
+        db.Index('ix_manga_views_id', 'views', 'id'),
+        db.Index('ix_manga_rating_id', 'rating', 'id'),
+        db.Index('ix_manga_published_date_id', 'published_date', 'id'),
+        db.Index('ix_manga_title_id', 'title', 'id'),
+    )
     
     id: Mapped[str] = mapped_column(db.String(64), primary_key=True, default=lambda: str(uuid.uuid4()))
     title: Mapped[str] = mapped_column(db.String(350), nullable=False)
@@ -23,6 +101,12 @@ class Manga(Base):
     rating: Mapped[float] = mapped_column(db.Float(), nullable=False)
     views: Mapped[int] = mapped_column(db.Integer, nullable=False)
     description: Mapped[str] = mapped_column(db.Text(10000), nullable=True)
+    version: Mapped[int] = mapped_column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=True, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    genres: Mapped[List["Genre"]] = relationship(secondary=manga_genre, backref="mangas")
     
 class User(Base):
     __tablename__ = 'user'
@@ -37,6 +121,8 @@ class Bookmark(Base):
     __tablename__ = 'bookmark'
     __table_args__ = (
         db.UniqueConstraint('user_id', 'manga_id', name='unique_user_bookmark'),
+        db.Index('ix_bookmark_user_id_added_at_id', 'user_id', 'added_at', 'id'),
+        db.Index('ix_bookmark_user_id_last_updated_id', 'user_id', 'last_updated', 'id'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -48,6 +134,7 @@ class Bookmark(Base):
     last_updated: Mapped[datetime] = mapped_column(db.DateTime, nullable=True)
     
     user = relationship("User", backref="bookmarks")
+    manga = relationship("Manga")
     
 class ReadingHistory(Base):
     __tablename__ = 'reading_history'
@@ -62,6 +149,21 @@ class ReadingHistory(Base):
     last_chapter: Mapped[str] = mapped_column(db.String(500), nullable=True)
     last_read_at: Mapped[datetime] = mapped_column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
+class ReadingEvent(Base):
+    # append-only; no foreign keys so deleting a user or manga never has to touch the log
+    __tablename__ = 'reading_event'
+    __table_args__ = (
+        db.Index('ix_reading_event_read_at', 'read_at'),
+    )
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    manga_id: Mapped[str] = mapped_column(db.String(64), nullable=False)
+    chapter_id: Mapped[str] = mapped_column(db.String(500), nullable=False)
+    read_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False)
+    # when the flush that wrote it ran; NULL on events written before the column existed
+    recorded_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime, nullable=True)
+    
 class Chapter(Base):
     __tablename__ = 'chapter'
     
@@ -71,11 +173,47 @@ class Chapter(Base):
     title: Mapped[str] = mapped_column(db.String(500), nullable=True)
     release_date: Mapped[datetime] = mapped_column(db.DateTime, nullable=False)
     language: Mapped[str] = mapped_column(db.String(50), default='en')
+    sort_key: Mapped[Optional[float]] = mapped_column(db.Float, nullable=True)
+    version: Mapped[int] = mapped_column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=True, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (
+        # covers the per-manga listing (MANGA_LISTING_FIELDS) as well as next/previous seeks
+        db.Index('ix_chapter_manga_listing', 'manga_id', 'language', 'sort_key', 'id', 'release_date', 'chapter_number'),
+        db.Index('ix_chapter_release_date_id', 'release_date', 'id'),
+        # chapter_stamp() reads a manga's chapter count, newest write and version total from here alone
+        db.Index('ix_chapter_manga_stamp', 'manga_id', 'updated_at', 'version'),
+        db.Index('ix_chapter_language_release_date_id', 'language', 'release_date', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
     manga = relationship("Manga", backref="chapters")
+
+# "Chapter 10.5" -> 10.5, "Vol.2 Ch.3" -> 3 (the chapter marker wins over the volume), "12" -> 12.
+# Numberless chapters such as "Extra" or "Oneshot" sort after every numbered one.
+UNNUMBERED_SORT_KEY = 1e9
+_CHAPTER_MARKER = re.compile(r'\b(?:ch(?:apter)?|ep(?:isode)?)\.?\s*(\d+(?:\.\d+)?)', re.IGNORECASE)
+_VOLUME_MARKER = re.compile(r'\b(?:vol(?:ume)?)\.?\s*\d+(?:\.\d+)?', re.IGNORECASE)
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+def chapter_sort_key(chapter_number):
+    if not chapter_number:
+        return UNNUMBERED_SORT_KEY
+    match = _CHAPTER_MARKER.search(chapter_number)
+    if match:
+        return float(match.group(1))
+    match = _NUMBER.search(_VOLUME_MARKER.sub('', chapter_number))
+    return float(match.group()) if match else UNNUMBERED_SORT_KEY
+
+@event.listens_for(Chapter.chapter_number, 'set')
+def _sync_chapter_sort_key(target, value, oldvalue, initiator):
+    target.sort_key = chapter_sort_key(value)
     
 class Download(Base):
     __tablename__ = 'download'
+    __table_args__ = (
+        db.Index('ux_download_user_id_chapter_id', 'user_id', 'chapter_id', unique=True),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(db.ForeignKey('user.id'), nullable=False)
@@ -0,0 +1,94 @@
+from collections import Counter
+from itertools import takewhile
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, delete
+from app.models import db, ReadingEvent, daily_manga_reads, daily_user_reads, rollup_watermark
+from app.utils.upsert import upsert
+
+# reading_event rows are folded into the daily_* tables in id order. rollup_watermark holds the last
+# id folded in, so each run only reads events newer than it and the counters are incremented rather
+# than recomputed. Raw events are pruned once they are both rolled up and past retention.
+#
+# Ids are handed out when a flush inserts, but concurrent flushes commit in any order, so a lower id
+# can become visible after a higher one and would be skipped by the watermark for good. A run only
+# folds the leading events recorded at least `lag` seconds ago: any lower id still in flight was
+# inserted earlier than the last one folded, so the lag only has to outlast a flush transaction.
+
+ROLLUP = 'reading_event'
+ROLLUP_BATCH_SIZE = 10000
+ROLLUP_LAG = 60
+PRUNE_CHUNK_SIZE = 5000
+
+def _watermark():
+    upsert(db.session, rollup_watermark, {'name': ROLLUP, 'last_id': 0}, ['name'])
+    return db.session.execute(select(rollup_watermark.c.last_id).where(rollup_watermark.c.name == ROLLUP)).scalar_one()
+
+def _utc(value):
+    # DateTime columns come back naive, holding UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _roll_up_batch(batch_size, lag):
+    settled = _utc(datetime.now(timezone.utc) - timedelta(seconds=lag))
+    watermark = _watermark()
+    events = db.session.execute(
+        select(ReadingEvent.id, ReadingEvent.user_id, ReadingEvent.manga_id, ReadingEvent.read_at, ReadingEvent.recorded_at)
+        .where(ReadingEvent.id > watermark)
+        .order_by(ReadingEvent.id)
+        .limit(batch_size)
+    ).all()
+    events = list(takewhile(lambda event: _utc(event.recorded_at or event.read_at) <= settled, events))
+    if not events:
+        db.session.commit()
+        return 0
+
+    # claiming the range first also locks the watermark row, so a concurrent run waits here and
+    # then finds the watermark moved instead of counting the same events twice
+    claimed = db.session.execute(
+        update(rollup_watermark)
+        .where(rollup_watermark.c.name == ROLLUP, rollup_watermark.c.last_id == watermark)
+        .values(last_id=events[-1].id)
+    )
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        return 0
+
+    manga_reads = Counter((event.read_at.date(), event.manga_id) for event in events)
+    user_reads = Counter((event.read_at.date(), event.user_id) for event in events)
+    upsert(
+        db.session, daily_manga_reads,
+        [{'day': day, 'manga_id': manga_id, 'reads': reads} for (day, manga_id), reads in manga_reads.items()],
+        ['day', 'manga_id'], increment=['reads']
+    )
+    upsert(
+        db.session, daily_user_reads,
+        [{'day': day, 'user_id': user_id, 'reads': reads} for (day, user_id), reads in user_reads.items()],
+        ['day', 'user_id'], increment=['reads']
+    )
+    db.session.commit()
+    return len(events)
+
+def roll_up_events(batch_size=ROLLUP_BATCH_SIZE, lag=ROLLUP_LAG):
+    # yields the number of events folded in per batch until caught up with events older than lag
+    while True:
+        folded = _roll_up_batch(batch_size, lag)
+        if not folded:
+            return
+        yield folded
+
+def prune_events(days, chunk_size=PRUNE_CHUNK_SIZE):
+    # yields the number of events deleted per chunk; events not yet rolled up are kept
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    watermark = _watermark()
+    db.session.commit()
+    while True:
+        ids = db.session.execute(
+            select(ReadingEvent.id)
+            .where(ReadingEvent.read_at < cutoff, ReadingEvent.id <= watermark)
+            .order_by(ReadingEvent.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return
+        db.session.execute(delete(ReadingEvent).where(ReadingEvent.id.in_(ids)))
+        db.session.commit()
+        yield len(ids)
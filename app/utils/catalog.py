@@ -0,0 +1,196 @@
+import json
+import uuid
+from itertools import islice
+from marshmallow import ValidationError
+from sqlalchemy import select, insert, tuple_, or_
+from app.models import db, Manga, Chapter, Genre, manga_genre, chapter_sort_key
+from app.blueprints.manga.schema import MangaSchema
+from app.blueprints.chapters.schema import ChapterImportSchema
+from app.extensions import invalidate
+from app.utils.genres import split_genres
+from app.utils.search import index_manga
+from app.utils.trigrams import index_titles
+from app.utils.chapter_counts import count_chapters
+
+# NDJSON catalog format shared by import and export: one object per line, tagged with
+# "type": "manga" or "type": "chapter". Manga lines are applied before chapter lines of the
+# same chunk, so a chapter may reference a manga a few lines above it. The checkpoint and end
+# lines written by app.utils.export are skipped, so an export can be fed straight back in.
+
+CHUNK_SIZE = 1000
+
+manga_import_schema = MangaSchema(many=True, load_instance=False)
+chapter_import_schema = ChapterImportSchema(many=True, load_instance=False)
+
+def _load(schema, records):
+    # exported records carry dump-only fields (version, updated_at) that the database owns
+    dump_only = [name for name, field in schema.fields.items() if field.dump_only]
+    for _, record in records:
+        for name in dump_only:
+            record.pop(name, None)
+    try:
+        return schema.load([record for _, record in records]), {}
+    except ValidationError as e:
+        return e.valid_data, e.messages
+
+class ChunkImporter:
+    def __init__(self):
+        self.genre_ids = {}
+
+    def _genre_ids(self, names):
+        missing = [name for name in names if name.lower() not in self.genre_ids]
+        if missing:
+            existing = db.session.execute(select(Genre.id, Genre.name)).all()
+            self.genre_ids.update((name.lower(), genre_id) for genre_id, name in existing)
+            new = [{'name': name} for name in dict.fromkeys(n for n in missing if n.lower() not in self.genre_ids)]
+            if new:
+                db.session.execute(insert(Genre), new)
+                existing = db.session.execute(select(Genre.id, Genre.name).where(Genre.name.in_([g['name'] for g in new]))).all()
+                self.genre_ids.update((name.lower(), genre_id) for genre_id, name in existing)
+        return [self.genre_ids[name.lower()] for name in names]
+
+    def insert_mangas(self, records, report):
+        loaded, errors = _load(manga_import_schema, records)
+        candidates = []
+        for i, (line, _) in enumerate(records):
+            if i in errors:
+                report['invalid'].append({'line': line, 'errors': errors[i]})
+            else:
+                candidates.append(loaded[i])
+
+        if not candidates:
+            return []
+
+        for row in candidates:
+            row.setdefault('id', str(uuid.uuid4()))
+
+        existing = db.session.execute(
+            select(Manga.id, Manga.title, Manga.author).where(or_(
+                tuple_(Manga.title, Manga.author).in_([(r['title'], r['author']) for r in candidates]),
+                Manga.id.in_([r['id'] for r in candidates])
+            ))
+        ).all()
+        seen_ids = {row.id for row in existing}
+        seen_pairs = {(row.title, row.author) for row in existing}
+
+        rows = []
+        for row in candidates:
+            if row['id'] in seen_ids or (row['title'], row['author']) in seen_pairs:
+                report['duplicates'] += 1
+                continue
+            seen_ids.add(row['id'])
+            seen_pairs.add((row['title'], row['author']))
+            rows.append(row)
+
+        if rows:
+            db.session.execute(insert(Manga), rows)
+            links = []
+            for row in rows:
+                names = split_genres(row['genre'])
+                links.extend({'manga_id': row['id'], 'genre_id': genre_id} for genre_id in self._genre_ids(names))
+            if links:
+                db.session.execute(insert(manga_genre), links)
+
+        report['manga_inserted'] += len(rows)
+        return rows
+
+    def insert_chapters(self, records, report):
+        loaded, errors = _load(chapter_import_schema, records)
+        candidates = []
+        for i, (line, _) in enumerate(records):
+            if i in errors:
+                report['invalid'].append({'line': line, 'errors': errors[i]})
+            else:
+                candidates.append((line, loaded[i]))
+
+        if not candidates:
+            return []
+
+        manga_ids = {row['manga_id'] for _, row in candidates}
+        known_mangas = set(db.session.execute(select(Manga.id).where(Manga.id.in_(manga_ids))).scalars())
+        existing = set(db.session.execute(
+            select(Chapter.manga_id, Chapter.chapter_number).where(
+                tuple_(Chapter.manga_id, Chapter.chapter_number).in_(
+                    [(row['manga_id'], row['chapter_number']) for _, row in candidates]
+                )
+            )
+        ).all())
+
+        rows = []
+        for line, row in candidates:
+            key = (row['manga_id'], row['chapter_number'])
+            if row['manga_id'] not in known_mangas:
+                report['invalid'].append({'line': line, 'errors': {'manga_id': ['Manga does not exist.']}})
+            elif key in existing:
+                report['duplicates'] += 1
+            else:
+                existing.add(key)
+                row.setdefault('id', str(uuid.uuid4()))
+                row['sort_key'] = chapter_sort_key(row['chapter_number'])
+                rows.append(row)
+
+        if rows:
+            db.session.execute(insert(Chapter), rows)
+            index_titles(db.session.connection(), [(row['id'], row.get('title')) for row in rows], replace=False)
+            count_chapters(db.session.connection(), rows)
+
+        report['chapters_inserted'] += len(rows)
+        return rows
+
+    def import_chunk(self, lines):
+        report = {
+            'first_line': lines[0][0],
+            'last_line': lines[-1][0],
+            'manga_inserted': 0,
+            'chapters_inserted': 0,
+            'duplicates': 0,
+            'invalid': []
+        }
+
+        mangas, chapters = [], []
+        for line, raw in lines:
+            try:
+                record = json.loads(raw)
+                kind = record.pop('type')
+            except (ValueError, AttributeError, KeyError):
+                report['invalid'].append({'line': line, 'errors': 'Expected a JSON object with a "type" field'})
+                continue
+
+            if kind == 'manga':
+                mangas.append((line, record))
+            elif kind == 'chapter':
+                chapters.append((line, record))
+            elif kind in ('checkpoint', 'end'):
+                continue
+            else:
+                report['invalid'].append({'line': line, 'errors': f"Unknown type {kind!r}"})
+
+        try:
+            inserted_mangas = self.insert_mangas(mangas, report) if mangas else []
+            inserted_chapters = self.insert_chapters(chapters, report) if chapters else []
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for row in inserted_mangas:
+            index_manga(Manga(**{key: row.get(key) for key in ('id', 'title', 'author', 'description')}))
+        tags = {f"manga:{row['manga_id']}:chapters" for row in inserted_chapters}
+        if inserted_mangas:
+            tags.add('manga:list')
+        if inserted_chapters:
+            tags.update(('chapter:list', 'chapter:latest'))
+        invalidate(*tags)
+
+        return report
+
+def import_catalog(lines, chunk_size=CHUNK_SIZE, skip=0):
+    # yields one report per committed chunk; report['last_line'] is the resume point for skip=
+    importer = ChunkImporter()
+    numbered = ((number, raw) for number, raw in enumerate(lines, start=1) if number > skip and raw.strip())
+
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        yield importer.import_chunk(chunk)
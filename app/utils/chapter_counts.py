@@ -0,0 +1,45 @@
+from collections import Counter
+from sqlalchemy import select, insert, delete, func, event, inspect
+from app.models import Chapter, manga_chapter_count
+from app.utils.upsert import upsert
+
+# Chapter totals per (manga_id, language), kept in step with the chapter table so unread badges
+# never count a manga's chapters at read time. ORM writes are tracked by the mapper events below;
+# Core bulk inserts call count_chapters() themselves.
+
+def adjust_counts(connection, deltas):
+    # deltas maps (manga_id, language) -> change in chapter count
+    rows = [
+        {'manga_id': manga_id, 'language': language, 'chapter_count': delta}
+        for (manga_id, language), delta in deltas.items() if delta
+    ]
+    upsert(connection, manga_chapter_count, rows, ['manga_id', 'language'], increment=['chapter_count'])
+
+def count_chapters(connection, rows):
+    adjust_counts(connection, Counter((row['manga_id'], row.get('language') or 'en') for row in rows))
+
+def rebuild_counts(connection):
+    connection.execute(delete(manga_chapter_count))
+    connection.execute(insert(manga_chapter_count).from_select(
+        ['manga_id', 'language', 'chapter_count'],
+        select(Chapter.manga_id, Chapter.language, func.count()).group_by(Chapter.manga_id, Chapter.language)
+    ))
+
+@event.listens_for(Chapter, 'after_insert')
+def _count_new_chapter(mapper, connection, target):
+    adjust_counts(connection, {(target.manga_id, target.language): 1})
+
+@event.listens_for(Chapter, 'after_update')
+def _recount_moved_chapter(mapper, connection, target):
+    state = inspect(target).attrs
+    if not (state.manga_id.history.has_changes() or state.language.history.has_changes()):
+        return
+    old_manga = state.manga_id.history.deleted[0] if state.manga_id.history.deleted else target.manga_id
+    old_language = state.language.history.deleted[0] if state.language.history.deleted else target.language
+    deltas = Counter({(target.manga_id, target.language): 1})
+    deltas[(old_manga, old_language)] -= 1
+    adjust_counts(connection, deltas)
+
+@event.listens_for(Chapter, 'after_delete')
+def _uncount_chapter(mapper, connection, target):
+    adjust_counts(connection, {(target.manga_id, target.language): -1})
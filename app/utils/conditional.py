@@ -0,0 +1,47 @@
+from flask import request, current_app, g
+from functools import wraps
+from datetime import timezone
+import hashlib
+
+CACHE_CONTROL = 'public, no-cache'
+
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def conditional(validators):
+    # validators(**view_kwargs) -> (etag, last_modified, surrogate_key), or None to let the view answer (e.g. 404)
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            resolved = validators(**kwargs)
+            if resolved is None:
+                return f(*args, **kwargs)
+
+            etag, last_modified, surrogate_key = resolved
+            g.validator = etag
+            if last_modified is not None and last_modified.tzinfo is None:
+                last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+            if _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            response.headers['Surrogate-Key'] = surrogate_key
+            return response
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,83 @@
+import heapq
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, delete, func, event, inspect
+from app.models import db, Chapter, Download, daily_chapter_downloads, daily_manga_downloads
+from app.utils.upsert import upsert
+
+# Download totals per (day, chapter) and (day, manga), written in the same transaction as the
+# download itself so top-N stats never scan the download table. ORM deletes and updates are tracked
+# by the mapper events below; the Core insert in create_download calls count_downloads() itself.
+
+def _day(downloaded_at):
+    return (downloaded_at or datetime.now(timezone.utc)).date()
+
+def adjust_downloads(connection, deltas):
+    # deltas maps (day, chapter_id) -> change in downloads
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    chapter_ids = {chapter_id for _, chapter_id in deltas}
+    mangas = dict(connection.execute(select(Chapter.id, Chapter.manga_id).where(Chapter.id.in_(chapter_ids))).all())
+    manga_deltas = Counter()
+    for (day, chapter_id), delta in deltas.items():
+        if chapter_id in mangas:
+            manga_deltas[(day, mangas[chapter_id])] += delta
+
+    upsert(
+        connection, daily_chapter_downloads,
+        [{'day': day, 'chapter_id': chapter_id, 'downloads': delta} for (day, chapter_id), delta in deltas.items()],
+        ['day', 'chapter_id'], increment=['downloads']
+    )
+    upsert(
+        connection, daily_manga_downloads,
+        [{'day': day, 'manga_id': manga_id, 'downloads': delta} for (day, manga_id), delta in manga_deltas.items() if delta],
+        ['day', 'manga_id'], increment=['downloads']
+    )
+
+def count_downloads(connection, rows):
+    adjust_downloads(connection, Counter((_day(row.get('downloaded_at')), row['chapter_id']) for row in rows))
+
+def rebuild_download_counts(connection):
+    day = func.date(Download.downloaded_at)
+    connection.execute(delete(daily_chapter_downloads))
+    connection.execute(delete(daily_manga_downloads))
+    connection.execute(insert(daily_chapter_downloads).from_select(
+        ['day', 'chapter_id', 'downloads'],
+        select(day, Download.chapter_id, func.count()).group_by(day, Download.chapter_id)
+    ))
+    connection.execute(insert(daily_manga_downloads).from_select(
+        ['day', 'manga_id', 'downloads'],
+        select(day, Chapter.manga_id, func.count()).join(Chapter, Chapter.id == Download.chapter_id).group_by(day, Chapter.manga_id)
+    ))
+
+def top_downloads(by, since, limit):
+    # one grouped pass over the window's counter rows, keeping the top `limit` in a heap
+    table = daily_manga_downloads if by == 'manga' else daily_chapter_downloads
+    key = table.c.manga_id if by == 'manga' else table.c.chapter_id
+    query = select(key, func.sum(table.c.downloads)).group_by(key)
+    if since is not None:
+        query = query.where(table.c.day >= since)
+
+    rows = db.session.execute(query.execution_options(yield_per=1000))
+    return heapq.nlargest(limit, ((total, id) for id, total in rows if total > 0))
+
+@event.listens_for(Download, 'after_update')
+def _recount_moved_download(mapper, connection, target):
+    state = inspect(target).attrs
+    if not (state.chapter_id.history.has_changes() or state.downloaded_at.history.has_changes()):
+        return
+    old_chapter = state.chapter_id.history.deleted[0] if state.chapter_id.history.deleted else target.chapter_id
+    old_at = state.downloaded_at.history.deleted[0] if state.downloaded_at.history.deleted else target.downloaded_at
+    deltas = Counter({(_day(target.downloaded_at), target.chapter_id): 1})
+    deltas[(_day(old_at), old_chapter)] -= 1
+    adjust_downloads(connection, deltas)
+
+@event.listens_for(Download, 'after_insert')
+def _count_new_download(mapper, connection, target):
+    adjust_downloads(connection, {(_day(target.downloaded_at), target.chapter_id): 1})
+
+@event.listens_for(Download, 'after_delete')
+def _uncount_download(mapper, connection, target):
+    adjust_downloads(connection, {(_day(target.downloaded_at), target.chapter_id): -1})
@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select
+from app.models import db, Download
+from app.extensions import tag_version, invalidate
+
+# Chapter ids each recently active user has downloaded, loaded on first access through the
+# (user_id, chapter_id) unique index and evicted least recently used. A miss still goes to the
+# database, whose unique index stays the source of truth, so a download recorded by another worker
+# only costs the insert that finds it. Removals bump the user's tag, but with a process-local cache
+# that bump never reaches the other workers, so a hit there is confirmed with one index lookup
+# before it is reported. Only a shared cache (e.g. RedisCache) lets a hit answer without a query.
+
+LOCAL_CACHES = {'simplecache', 'simple', 'nullcache', 'null'}
+
+def downloads_tag(user_id):
+    return f'user:{user_id}:downloads'
+
+class UserDownloads:
+    def __init__(self, version, chapter_ids):
+        self.version = version
+        self.chapter_ids = set(chapter_ids)
+
+class DownloadFilter:
+    def __init__(self, max_users, shared=False):
+        self.max_users = max_users
+        self.shared = shared
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _load(self, user_id):
+        # read the token before the rows: a removal racing the load leaves a stale token, not stale rows
+        version = tag_version(downloads_tag(user_id))
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None and entry.version == version:
+                self.users.move_to_end(user_id)
+                return entry
+
+        entry = UserDownloads(version, db.session.execute(
+            select(Download.chapter_id).where(Download.user_id == user_id)
+        ).scalars())
+
+        with self.lock:
+            self.users[user_id] = entry
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        return entry
+
+    def contains(self, user_id, chapter_id):
+        entry = self._load(user_id)
+        if chapter_id not in entry.chapter_ids:
+            return False
+        if self.shared:
+            return True
+
+        exists = db.session.execute(
+            select(Download.id).where(Download.user_id == user_id, Download.chapter_id == chapter_id)
+        ).first()
+        if exists is None:
+            # removed by a worker whose invalidation this process never saw
+            with self.lock:
+                entry.chapter_ids.discard(chapter_id)
+            return False
+        return True
+
+    def add(self, user_id, chapter_id):
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None:
+                entry.chapter_ids.add(chapter_id)
+
+    def removed(self, user_id):
+        # call after the delete commits
+        with self.lock:
+            self.users.pop(user_id, None)
+        invalidate(downloads_tag(user_id))
+
+def _shared_cache(cache_type):
+    return cache_type.rsplit('.', 1)[-1].lower() not in LOCAL_CACHES
+
+def download_filter():
+    return current_app.extensions.setdefault('download_filter', DownloadFilter(
+        current_app.config.get('DOWNLOAD_FILTER_USERS', 1024),
+        shared=_shared_cache(current_app.config.get('CACHE_TYPE', 'SimpleCache'))
+    ))
@@ -0,0 +1,69 @@
+import zlib
+from flask import request, current_app, stream_with_context
+from app.models import db
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.serializers import row_serializer
+
+# Records are written in the app.utils.catalog NDJSON format, in primary key order. After every batch a
+# {"type": "checkpoint", "resume_token": ...} line is written and the stream ends with {"type": "end"},
+# so a client that lost the connection passes the last token it saw and continues from there.
+
+EXPORT_BATCH_SIZE = 1000
+MAX_EXPORT_BATCH_SIZE = 10000
+STREAM_BATCH_SIZE = 1000
+
+def export_catalog(kind, model, schema_cls, resume_token=None, batch_size=EXPORT_BATCH_SIZE):
+    # the resume token is decoded here rather than in the generator so a bad one fails before streaming
+    serializer = row_serializer(schema_cls)
+    query = serializer.select(model.id).order_by(model.id)
+    if resume_token:
+        last_id, = decode_cursor(resume_token, [model.id])
+        query = query.where(model.id > last_id)
+    return _export_batches(kind, serializer, query, batch_size)
+
+def _export_batches(kind, serializer, query, batch_size):
+    dumps = current_app.json.dumps
+    serialize = serializer.serialize
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+
+    for rows in result.partitions():
+        lines = [dumps({'type': kind, **serialize(row)}) for row in rows]
+        lines.append(dumps({'type': 'checkpoint', 'resume_token': encode_cursor([rows[-1].id])}))
+        yield '\n'.join(lines) + '\n'
+
+    yield dumps({'type': 'end'}) + '\n'
+
+def _gzip(chunks):
+    # sync-flush after every chunk so everything up to the last checkpoint is decodable if the connection drops
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def ndjson_response(chunks):
+    compress = 'gzip' in request.accept_encodings
+    body = stream_with_context(_gzip(chunks) if compress else chunks)
+    response = current_app.response_class(body, mimetype='application/x-ndjson')
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.content_encoding = 'gzip'
+    return response
+
+def _json_array(query, dump, key, batch_size, scalars, envelope):
+    dumps = current_app.json.dumps
+    fields = dumps(envelope)[1:-1] if envelope else ''
+    yield '{' + (fields + ',' if fields else '') + dumps(key) + ':['
+
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    separator = ''
+    for rows in (result.scalars() if scalars else result).partitions():
+        yield separator + ','.join(dumps(item) for item in dump(rows))
+        separator = ','
+
+    yield ']}'
+
+def json_array_response(query, dump, key, batch_size=STREAM_BATCH_SIZE, scalars=False, **envelope):
+    # {**envelope, key: [...]} written batch by batch from a server-side cursor, so neither the rows nor
+    # the JSON body are ever held in memory whole. dump turns one batch of rows into a list of dicts
+    body = stream_with_context(_json_array(query, dump, key, batch_size, scalars, envelope))
+    return current_app.response_class(body, mimetype='application/json')
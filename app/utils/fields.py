@@ -0,0 +1,33 @@
+from flask import request
+from functools import lru_cache
+from sqlalchemy.orm import load_only
+
+class InvalidFields(ValueError):
+    pass
+
+def requested_fields(schema_cls):
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+
+    names = tuple(sorted({name.strip() for name in raw.split(',') if name.strip()}))
+    dumpable = {name for name, field in schema_cls._declared_fields.items() if not field.load_only}
+    unknown = [name for name in names if name not in dumpable]
+    if not names or unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(sorted(dumpable))}")
+
+    return names
+
+@lru_cache(maxsize=256)
+def schema_for(schema_cls, fields=None, many=False):
+    return schema_cls(only=fields, many=many)
+
+def sparse_fieldset(query, model, schema_cls, many=False, keep=()):
+    # keep lists columns the route itself reads (ordering keys for cursors, ids for lookups) so
+    # load_only never leaves them to be lazy-loaded one row at a time
+    fields = requested_fields(schema_cls)
+    if fields:
+        columns = model.__table__.columns
+        names = [name for name in dict.fromkeys(fields + tuple(c.key for c in keep)) if name in columns]
+        query = query.options(load_only(*[getattr(model, name) for name in names]))
+    return query, schema_for(schema_cls, fields, many)
@@ -0,0 +1,60 @@
+import re
+from sqlalchemy import select, func
+from app.models import db, Genre, Manga, manga_genre
+from app.utils.upsert import upsert
+
+GENRE_SEPARATORS = re.compile(r"[,;/|]")
+
+def split_genres(value):
+    names = {}
+    for name in GENRE_SEPARATORS.split(value or ''):
+        name = name.strip()
+        if name and name.lower() not in names:
+            names[name.lower()] = name
+    return list(names.values())
+
+def resolve_genres(names):
+    if not names:
+        return []
+
+    # Genre.name compares case-insensitively (MySQL's default collation, NOCASE on SQLite), so the
+    # lookup stays on its unique index. Missing names are inserted-or-ignored, so two requests
+    # creating the same genre both end up with the one row
+    query = select(Genre).where(Genre.name.in_(names))
+    by_name = {genre.name.lower(): genre for genre in db.session.execute(query).scalars()}
+    missing = [name for name in names if name.lower() not in by_name]
+    if missing:
+        upsert(db.session, Genre.__table__, [{'name': name} for name in missing], ['name'])
+        by_name = {genre.name.lower(): genre for genre in db.session.execute(query).scalars()}
+
+    return [by_name[name.lower()] for name in names if name.lower() in by_name]
+
+def sync_genres(manga):
+    manga.genres = resolve_genres(split_genres(manga.genre))
+
+def filter_by_genres(query, names, match_all=True):
+    lowered = list({name.strip().lower() for name in names if name.strip()})
+    if not lowered:
+        return query
+
+    genre_ids = select(Genre.id).where(Genre.name.in_(lowered))
+    matches = select(manga_genre.c.manga_id).where(manga_genre.c.genre_id.in_(genre_ids))
+    if match_all and len(lowered) > 1:
+        matches = matches.group_by(manga_genre.c.manga_id).having(func.count() == len(lowered))
+
+    return query.where(Manga.id.in_(matches))
+
+def genre_facets(names=(), match_all=True):
+    count = func.count(manga_genre.c.manga_id)
+    query = (
+        select(Genre.name, count.label('count'))
+        .join(manga_genre, manga_genre.c.genre_id == Genre.id)
+        .group_by(Genre.id, Genre.name)
+        .order_by(count.desc(), Genre.name)
+    )
+
+    if any(name.strip() for name in names):
+        filtered = filter_by_genres(select(Manga.id), names, match_all)
+        query = query.where(manga_genre.c.manga_id.in_(filtered))
+
+    return [{'name': name, 'count': total} for name, total in db.session.execute(query)]
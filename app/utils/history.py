@@ -0,0 +1,159 @@
+import atexit
+import threading
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import DBAPIError, OperationalError
+from app.models import db, ReadingHistory, ReadingEvent
+from app.utils.upsert import upsert
+
+# Chapter reads are recorded in memory and written in batches off the request path. Only the latest
+# read per (user_id, manga_id) is kept, so a reader paging through a manga costs one row update per
+# flush. Flushes happen every HISTORY_FLUSH_INTERVAL seconds or once HISTORY_MAX_PENDING reads are
+# waiting, and whatever is left is written at interpreter exit. With HISTORY_WRITE_BEHIND off (tests)
+# every read is written before record() returns. Every read is also appended to reading_event in the
+# same flush, uncoalesced, for the daily rollups in app.utils.analytics.
+#
+# A flush that fails on a transient error (deadlock, lost connection) is put back and retried on the
+# next cycle, keeping at most HISTORY_MAX_RETAINED events. Any other database error is confined to
+# the rows causing it: the batch is retried one (user_id, manga_id) at a time and the rows that still
+# fail, e.g. a user deleted after their token was issued, are logged and dropped.
+
+class HistoryRecorder:
+    def __init__(self, app, max_pending=500, flush_interval=1.0, synchronous=False, max_retained=5000):
+        self.app = app
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.pending = {}
+        self.events = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def record(self, user_id, manga_id, chapter_id, read_at=None):
+        read_at = read_at or datetime.now(timezone.utc)
+        with self.lock:
+            current = self.pending.get((user_id, manga_id))
+            if current is None or current[1] <= read_at:
+                self.pending[(user_id, manga_id)] = (chapter_id, read_at)
+            self.events.append({'user_id': user_id, 'manga_id': manga_id, 'chapter_id': chapter_id, 'read_at': read_at})
+            size = len(self.events)
+
+        if self.synchronous:
+            self.flush()
+            return
+
+        self._ensure_thread()
+        if size >= self.max_pending:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                entries, self.pending = self.pending, {}
+                events, self.events = self.events, []
+            if not entries:
+                return 0
+
+            with self.app.app_context():
+                try:
+                    _write(entries, events)
+                except OperationalError:
+                    db.session.rollback()
+                    self._requeue(entries, events)
+                    raise
+                except DBAPIError:
+                    db.session.rollback()
+                    self._write_each(entries, events)
+                except Exception:
+                    self._requeue(entries, events)
+                    raise
+            return len(entries)
+
+    def _write_each(self, entries, events):
+        # every event's (user_id, manga_id) has an entry: record() and _requeue() always keep one
+        by_key = {}
+        for event in events:
+            by_key.setdefault((event['user_id'], event['manga_id']), []).append(event)
+        keys = list(entries)
+        for i, key in enumerate(keys):
+            try:
+                _write({key: entries[key]}, by_key.get(key, []))
+            except OperationalError:
+                db.session.rollback()
+                self._requeue({k: entries[k] for k in keys[i:]}, [event for k in keys[i:] for event in by_key.get(k, [])])
+                raise
+            except DBAPIError as e:
+                db.session.rollback()
+                self.app.logger.warning('Dropping reading history for user %s, manga %s: %s', key[0], key[1], e.orig)
+
+    def _requeue(self, entries, events):
+        with self.lock:
+            self.events[:0] = events
+            overflow = len(self.events) - self.max_retained
+            if overflow > 0:
+                del self.events[:overflow]
+                self.app.logger.warning('Dropped %d reading events waiting on a failing flush', overflow)
+            for key, (chapter_id, read_at) in entries.items():
+                current = self.pending.get(key)
+                if current is None or current[1] < read_at:
+                    self.pending[key] = (chapter_id, read_at)
+
+    def _ensure_thread(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='history-recorder', daemon=True)
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Reading history flush failed; retrying on the next cycle')
+
+    def stop(self):
+        # drain: stop the worker, then write anything recorded after its last flush
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+def _write(entries, events):
+    table = ReadingHistory.__table__
+    rows = [
+        {'user_id': user_id, 'manga_id': manga_id, 'last_chapter': chapter_id, 'last_read_at': read_at}
+        for (user_id, manga_id), (chapter_id, read_at) in entries.items()
+    ]
+    # a read flushed by another worker with a later timestamp wins; last_read_at is assigned last
+    # so MySQL evaluates the guard against the stored value
+    upsert(
+        db.session, table, rows, ['user_id', 'manga_id'],
+        update=['last_chapter', 'last_read_at'],
+        only_if=lambda incoming: or_(table.c.last_read_at.is_(None), table.c.last_read_at <= incoming('last_read_at'))
+    )
+    recorded_at = datetime.now(timezone.utc)
+    db.session.execute(insert(ReadingEvent), [{**event, 'recorded_at': recorded_at} for event in events])
+    db.session.commit()
+
+def init_history(app):
+    app.extensions['history_recorder'] = HistoryRecorder(
+        app,
+        max_pending=app.config.get('HISTORY_MAX_PENDING', 500),
+        flush_interval=app.config.get('HISTORY_FLUSH_INTERVAL', 1.0),
+        synchronous=not app.config.get('HISTORY_WRITE_BEHIND', True),
+        max_retained=app.config.get('HISTORY_MAX_RETAINED', 5000)
+    )
+
+def history_recorder():
+    return current_app.extensions['history_recorder']
@@ -0,0 +1,113 @@
+import threading
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import select
+from app.models import db, Chapter
+from app.extensions import tag_version, invalidate
+from app.utils.pagination import keyset_paginate, encode_cursor, decode_cursor
+from app.utils.serializers import row_serializer
+from app.blueprints.chapters.schema import ChapterImportSchema
+
+# The newest chapter releases kept in memory, bounded to LATEST_CHAPTERS_SIZE and sorted by
+# (release_date, id). create_chapter publishes into it directly; any other chapter write invalidates
+# the 'chapter:latest' tag and the buffer reloads itself from ix_chapter_release_date_id on next use.
+# Each use also reads the newest (release_date, id) from that index, so a chapter released by another
+# worker or a CLI import reloads the buffer too; edits and deletes made elsewhere are picked up once
+# the tag token expires.
+# Pages that run past the oldest buffered release fall back to a keyset scan of the same index.
+# Chapters are dumped with ChapterImportSchema so uuid manga ids stay strings.
+
+TAG = 'chapter:latest'
+LATEST_ORDER = [(Chapter.release_date, True), (Chapter.id, True)]
+
+class LatestChapters:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.keys = []
+        self.entries = {}
+        self.complete = False
+        self.version = None
+        self.lock = threading.RLock()
+
+    def _head(self):
+        row = db.session.execute(
+            select(Chapter.release_date, Chapter.id).order_by(Chapter.release_date.desc(), Chapter.id.desc()).limit(1)
+        ).first()
+        return tuple(row) if row else None
+
+    def _load(self):
+        version = (tag_version(TAG), self._head())
+        if self.version == version:
+            return
+
+        serializer = row_serializer(ChapterImportSchema)
+        query = serializer.select(Chapter.release_date, Chapter.id, Chapter.language)
+        query = query.order_by(Chapter.release_date.desc(), Chapter.id.desc()).limit(self.capacity)
+        rows = db.session.execute(query).all()
+
+        self.keys = sorted((row.release_date, row.id) for row in rows)
+        self.entries = {row.id: (row.language, serializer.serialize(row)) for row in rows}
+        self.complete = len(rows) < self.capacity
+        self.version = version
+
+    def _insert(self, key, language, chapter):
+        if len(self.keys) >= self.capacity and key < self.keys[0]:
+            return
+        insort(self.keys, key)
+        self.entries[key[1]] = (language, chapter)
+        if len(self.keys) > self.capacity:
+            _, evicted = self.keys.pop(0)
+            del self.entries[evicted]
+            self.complete = False
+
+    def publish(self, chapter):
+        # keep the buffer only if it was current before this write; otherwise let it reload
+        serializer = row_serializer(ChapterImportSchema)
+        row = tuple(getattr(chapter, column.key) for column in serializer.columns)
+        key = (chapter.release_date, chapter.id)
+        with self.lock:
+            current = self.version is not None and self.version[0] == tag_version(TAG)
+            invalidate(TAG)
+            head = self._head()
+            # this chapter must be the only release since the buffer was loaded
+            if current and head == max(k for k in (self.version[1], key) if k is not None):
+                self._insert(key, chapter.language, serializer.serialize(row))
+                self.version = (tag_version(TAG), head)
+
+    def page(self, per_page, cursor=None, language=None):
+        with self.lock:
+            self._load()
+            position = len(self.keys)
+            if cursor:
+                position = bisect_left(self.keys, tuple(decode_cursor(cursor, [Chapter.release_date, Chapter.id])))
+
+            chapters = []
+            last_key = None
+            while position > 0:
+                position -= 1
+                key = self.keys[position]
+                chapter_language, chapter = self.entries[key[1]]
+                if language and chapter_language != language:
+                    continue
+                if len(chapters) == per_page:
+                    return chapters, encode_cursor(last_key)
+                chapters.append(chapter)
+                last_key = key
+
+            if self.complete:
+                return chapters, None
+
+        return self._page_from_index(per_page, cursor, language)
+
+    def _page_from_index(self, per_page, cursor, language):
+        serializer = row_serializer(ChapterImportSchema)
+        query = serializer.select(Chapter.release_date, Chapter.id)
+        if language:
+            query = query.where(Chapter.language == language)
+        rows, next_cursor = keyset_paginate(query, LATEST_ORDER, cursor, per_page, scalars=False)
+        return serializer.dump(rows), next_cursor
+
+def latest_chapters():
+    return current_app.extensions.setdefault(
+        'latest_chapters', LatestChapters(current_app.config.get('LATEST_CHAPTERS_SIZE', 1000))
+    )
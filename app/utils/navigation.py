@@ -0,0 +1,107 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select, func
+from app.models import db, Chapter, chapter_sort_key
+from app.extensions import tag_version
+
+# Per-manga chapter order kept in memory as sorted (sort_key, id) arrays, one per language, so a
+# navigation lookup is a bisect instead of reading the manga's chapters. Each entry remembers the
+# manga's chapter_stamp() and the version token of its chapters tag, and is rebuilt once either no
+# longer matches: the stamp catches chapter writes from other workers and CLI commands, the token's
+# expiry catches Core updates that touch neither version nor updated_at.
+
+def chapter_stamp(manga_id):
+    # index-only on ix_chapter_manga_stamp: inserts, deletes and moves change the count, ORM updates
+    # bump version and updated_at
+    return tuple(db.session.execute(
+        select(func.count(), func.max(Chapter.updated_at), func.sum(Chapter.version)).where(Chapter.manga_id == manga_id)
+    ).one())
+
+class MangaChapters:
+    def __init__(self, version, rows):
+        self.version = version
+        self.keys = {}
+        self.chapters = {}
+        for chapter_id, language, sort_key, chapter_number in rows:
+            if sort_key is None:
+                sort_key = chapter_sort_key(chapter_number)
+            self.keys.setdefault(language, []).append((sort_key, chapter_id))
+            self.chapters[chapter_id] = (language, sort_key)
+
+        for keys in self.keys.values():
+            keys.sort()
+
+    def nav(self, chapter_id):
+        language, sort_key = self.chapters[chapter_id]
+        keys = self.keys[language]
+        position = bisect_left(keys, (sort_key, chapter_id))
+
+        return {
+            'language': language,
+            'position': position + 1,
+            'total': len(keys),
+            'first': keys[0][1],
+            'previous': keys[position - 1][1] if position > 0 else None,
+            'next': keys[position + 1][1] if position + 1 < len(keys) else None,
+            'last': keys[-1][1]
+        }
+
+class ChapterNavigation:
+    def __init__(self, max_mangas):
+        self.max_mangas = max_mangas
+        self.mangas = OrderedDict()
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def _load(self, manga_id):
+        # read the stamp before the rows: a write racing the build leaves a stale stamp, not stale rows
+        version = (tag_version(f'manga:{manga_id}:chapters'), chapter_stamp(manga_id))
+        with self.lock:
+            entry = self.mangas.get(manga_id)
+            if entry is not None and entry.version == version:
+                self.mangas.move_to_end(manga_id)
+                return entry
+
+        rows = db.session.execute(
+            select(Chapter.id, Chapter.language, Chapter.sort_key, Chapter.chapter_number)
+            .where(Chapter.manga_id == manga_id)
+        ).all()
+        entry = MangaChapters(version, rows)
+
+        with self.lock:
+            self._drop(manga_id)
+            self.mangas[manga_id] = entry
+            self.owners.update((chapter_id, manga_id) for chapter_id in entry.chapters)
+            while len(self.mangas) > self.max_mangas:
+                self._drop(next(iter(self.mangas)))
+        return entry
+
+    def _drop(self, manga_id):
+        entry = self.mangas.pop(manga_id, None)
+        if entry is not None:
+            for chapter_id in entry.chapters:
+                if self.owners.get(chapter_id) == manga_id:
+                    del self.owners[chapter_id]
+
+    def nav(self, chapter_id):
+        manga_id = self.owners.get(chapter_id)
+        if manga_id is not None:
+            entry = self._load(manga_id)
+            if chapter_id in entry.chapters:
+                return dict(entry.nav(chapter_id), chapter_id=chapter_id, manga_id=manga_id)
+
+        # unknown chapter, or one that moved to another manga since the entry was built
+        manga_id = db.session.execute(select(Chapter.manga_id).where(Chapter.id == chapter_id)).scalar_one_or_none()
+        if manga_id is None:
+            return None
+        entry = self._load(manga_id)
+        if chapter_id not in entry.chapters:
+            return None
+        return dict(entry.nav(chapter_id), chapter_id=chapter_id, manga_id=manga_id)
+
+def chapter_navigation():
+    return current_app.extensions.setdefault(
+        'chapter_navigation', ChapterNavigation(current_app.config.get('CHAPTER_NAV_CACHE_SIZE', 1024))
+    )
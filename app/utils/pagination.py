@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_, false, cast, literal, Float
+from app.models import db
+
+class InvalidCursor(ValueError):
+    pass
+
+class InvalidSort(ValueError):
+    pass
+
+class InvalidPerPage(ValueError):
+    pass
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _load_value(value, column):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(values):
+    raw = json.dumps([_dump_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor(cursor)
+        return [_load_value(v, c) for v, c in zip(values, columns)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+def _bind(column, value):
+    # a MySQL FLOAT column holds float32; cast the cursor's double to the same precision or a stored
+    # 4.7 (4.6999998...) never equals the 4.7 read back from it and ties repeat across pages
+    return cast(literal(value), column.type) if isinstance(column.type, Float) else value
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == _bind(column, value)
+
+def _step(column, value, descending):
+    # NULL sorts before every value on MySQL and SQLite, so it is the smallest key in either direction
+    if value is None:
+        return false() if descending else column.is_not(None)
+    value = _bind(column, value)
+    if descending:
+        return or_(column < value, column.is_(None)) if column.nullable else column < value
+    return column > value
+
+def keyset_after(order, values):
+    # (a, b) after (x, y) == a > x OR (a = x AND b > y), with > flipped for descending keys
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [_equal(c, v) for (c, _), v in zip(order[:i], values[:i])]
+        clauses.append(and_(*equal, _step(column, values[i], descending)))
+    return or_(*clauses)
+
+def parse_sort(sort, columns, tiebreaker):
+    # "views" sorts ascending, "-views" descending; the tiebreaker follows the same direction
+    # so a single composite (column, tiebreaker) index can serve both
+    descending = sort.startswith('-')
+    column = columns.get(sort[1:] if descending else sort)
+    if column is None:
+        raise InvalidSort(sort)
+    return [(column, descending), (tiebreaker, descending)]
+
+def order_by_clauses(order):
+    return [c.desc() if d else c.asc() for c, d in order]
+
+def keyset_paginate(query, order, cursor, per_page, scalars=True):
+    # order is a list of (column, descending) pairs; the last column must be unique. With
+    # scalars=False the query's Core rows are returned and must include every order column
+    columns = [column for column, _ in order]
+    if per_page < 1:
+        raise InvalidPerPage(per_page)
+
+    if cursor:
+        query = query.where(keyset_after(order, decode_cursor(cursor, columns)))
+
+    query = query.order_by(*order_by_clauses(order)).limit(per_page + 1)
+    result = db.session.execute(query)
+    rows = (result.scalars() if scalars else result).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+
+    return rows, next_cursor
@@ -0,0 +1,114 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from flask import current_app
+from sqlalchemy import select
+from app.models import db, Manga
+
+TOKEN_RE = re.compile(r"\w+")
+
+# a title hit counts three times as much as a description hit
+MANGA_FIELDS = {'title': 3, 'author': 2, 'description': 1}
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+class InvertedIndex:
+    def __init__(self, fields, k1=1.2, b=0.75):
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.built = False
+        self.lock = threading.RLock()
+
+    def _add(self, doc_id, doc):
+        terms = Counter()
+        for field, weight in self.fields.items():
+            for token in tokenize(doc.get(field)):
+                terms[token] += weight
+
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf
+
+    def _remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def build(self, docs):
+        with self.lock:
+            self.postings.clear()
+            self.doc_terms.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+            for doc_id, doc in docs:
+                self._add(doc_id, doc)
+            self.built = True
+
+    def add(self, doc_id, doc):
+        with self.lock:
+            self._remove(doc_id)
+            self._add(doc_id, doc)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def search(self, query, offset=0, limit=10):
+        with self.lock:
+            n = len(self.doc_lengths)
+            if n == 0:
+                return 0, []
+            avg_length = self.total_length / n
+
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), [doc_id for doc_id, _ in top[offset:]]
+
+def _manga_doc(manga):
+    return {field: getattr(manga, field) for field in MANGA_FIELDS}
+
+def manga_index():
+    index = current_app.extensions.setdefault('manga_index', InvertedIndex(MANGA_FIELDS))
+    if not index.built:
+        with index.lock:
+            if not index.built:
+                query = select(Manga.id, *[getattr(Manga, f) for f in MANGA_FIELDS]).execution_options(yield_per=1000)
+                rows = db.session.execute(query)
+                index.build((row.id, row._asdict()) for row in rows)
+    return index
+
+def index_manga(manga):
+    index = current_app.extensions.get('manga_index')
+    if index is not None and index.built:
+        index.add(manga.id, _manga_doc(manga))
+
+def unindex_manga(manga_id):
+    index = current_app.extensions.get('manga_index')
+    if index is not None and index.built:
+        index.remove(manga_id)
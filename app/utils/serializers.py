@@ -0,0 +1,72 @@
+from functools import lru_cache
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import fields
+from sqlalchemy import select
+import orjson
+
+# Read-only fast path for list endpoints: select plain Core rows for exactly the columns a schema
+# dumps and turn them into dicts with converters resolved once per schema, instead of hydrating ORM
+# instances and dispatching through marshmallow for every field of every row.
+
+def _converter(name, field):
+    if type(field) is fields.String:
+        return None
+    if isinstance(field, (fields.DateTime, fields.Date)):
+        format_func = field.SERIALIZATION_FUNCS.get(field.format or field.DEFAULT_FORMAT)
+        if format_func:
+            return format_func
+    if isinstance(field, fields.Boolean):
+        return bool
+    if isinstance(field, fields.Number) and not field.as_string:
+        return field.num_type
+    return lambda value: field._serialize(value, name, None)
+
+class RowSerializer:
+    def __init__(self, schema_cls, only=None):
+        schema = schema_cls(only=only)
+        model = schema.opts.model
+
+        self.keys = []
+        self.columns = []
+        self.converters = []
+        for name, field in schema.dump_fields.items():
+            self.keys.append(field.data_key or name)
+            self.columns.append(getattr(model, field.attribute or name))
+            self.converters.append(_converter(name, field))
+
+        plan = tuple(zip(self.keys, range(len(self.keys)), self.converters))
+        self.serialize = lambda row: {
+            key: row[i] if convert is None or row[i] is None else convert(row[i])
+            for key, i, convert in plan
+        }
+
+    def select(self, *extra):
+        # extra columns (cursor keys) are appended after the dumped ones so positions stay stable
+        return select(*self.columns, *[column for column in extra if column not in self.columns])
+
+    def dump(self, rows):
+        serialize = self.serialize
+        return [serialize(row) for row in rows]
+
+@lru_cache(maxsize=256)
+def row_serializer(schema_cls, only=None):
+    return RowSerializer(schema_cls, only)
+
+class FastJSONProvider(DefaultJSONProvider):
+    def _options(self):
+        # dates still go through Flask's default hook so raw datetimes keep their HTTP-date format
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,74 @@
+import math
+import re
+from sqlalchemy import select, insert, delete, func, event, inspect
+from app.models import db, Chapter, chapter_trigram
+
+WORD_RE = re.compile(r"\w+")
+
+# A title matches when it shares at least MIN_SIMILARITY of the query's trigrams, which tolerates
+# typos and partial words. Matches are ranked by shared trigrams, then by shorter title.
+MIN_SIMILARITY = 0.5
+
+def trigrams(text):
+    grams = set()
+    for word in WORD_RE.findall(text.lower()) if text else []:
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def index_titles(connection, chapters, replace=True):
+    # chapters is an iterable of (chapter_id, title); replace=False skips the delete for brand-new rows
+    chapters = list(chapters)
+    if replace and chapters:
+        connection.execute(delete(chapter_trigram).where(chapter_trigram.c.chapter_id.in_([c for c, _ in chapters])))
+
+    postings = [{'trigram': gram, 'chapter_id': chapter_id} for chapter_id, title in chapters for gram in trigrams(title)]
+    if postings:
+        connection.execute(insert(chapter_trigram), postings)
+
+def search_titles(query, page=1, per_page=10, manga_id=None, language=None):
+    grams = trigrams(query)
+    if not grams:
+        return 0, []
+
+    # postings are aggregated on the (trigram, chapter_id) primary key alone; chapter rows are only
+    # joined for filters and for ranking the candidates that survive the similarity cut
+    hits = func.count().label('hits')
+    postings = select(chapter_trigram.c.chapter_id, hits).where(chapter_trigram.c.trigram.in_(grams))
+    if manga_id is not None or language:
+        postings = postings.join(Chapter, Chapter.id == chapter_trigram.c.chapter_id)
+        if manga_id is not None:
+            postings = postings.where(Chapter.manga_id == manga_id)
+        if language:
+            postings = postings.where(Chapter.language == language)
+    matches = (
+        postings.group_by(chapter_trigram.c.chapter_id)
+        .having(hits >= math.ceil(len(grams) * MIN_SIMILARITY))
+        .subquery()
+    )
+
+    # the total rides along as a window count so the postings are aggregated once per request
+    ranked = (
+        select(Chapter.id, func.count().over().label('total'))
+        .join(matches, matches.c.chapter_id == Chapter.id)
+        .order_by(matches.c.hits.desc(), func.length(Chapter.title), Chapter.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+    )
+    rows = db.session.execute(ranked).all()
+    if not rows:
+        return db.session.execute(select(func.count()).select_from(matches)).scalar(), []
+    return rows[0].total, [row.id for row in rows]
+
+@event.listens_for(Chapter, 'after_insert')
+def _index_new_chapter(mapper, connection, target):
+    index_titles(connection, [(target.id, target.title)], replace=False)
+
+@event.listens_for(Chapter, 'after_update')
+def _reindex_chapter(mapper, connection, target):
+    if inspect(target).attrs.title.history.has_changes():
+        index_titles(connection, [(target.id, target.title)])
+
+@event.listens_for(Chapter, 'before_delete')
+def _unindex_chapter(mapper, connection, target):
+    connection.execute(delete(chapter_trigram).where(chapter_trigram.c.chapter_id == target.id))
@@ -0,0 +1,133 @@
+from collections import namedtuple
+from sqlalchemy import update as sql_update, bindparam, func, literal_column
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+# One statement per upsert instead of SELECT-then-INSERT/UPDATE, so concurrent writers to the
+# same unique key never race into an IntegrityError. Every call reports how many rows it
+# inserted and how many existing rows it updated.
+#
+#   update     columns overwritten with the incoming value on conflict
+#   increment  columns the incoming value is added to on conflict
+#   only_if    callable(incoming) -> clause; the conflicting row is only updated when it holds.
+#              incoming(name) is the value the statement proposed for that column
+#
+# With neither update nor increment a conflicting row is left alone (insert-or-ignore).
+
+UpsertResult = namedtuple('UpsertResult', ['inserted', 'updated'])
+
+MYSQL_DUPLICATE_KEY = 1062
+
+def upsert(executor, table, rows, keys, update=(), increment=(), only_if=None):
+    rows = [rows] if isinstance(rows, dict) else list(rows)
+    if not rows:
+        return UpsertResult(0, 0)
+
+    # a Session (or db.session) resolves its engine, a Connection carries its own dialect
+    bind = executor.get_bind() if hasattr(executor, 'get_bind') else executor
+    dialect = bind.dialect.name
+    if dialect == 'mysql':
+        return _mysql(executor, table, rows, update, increment, only_if)
+    if dialect == 'postgresql':
+        return _postgresql(executor, table, rows, keys, update, increment, only_if)
+    if dialect == 'sqlite':
+        return _sqlite(executor, table, rows, keys, update, increment, only_if)
+    raise NotImplementedError(f"upsert is not supported on {dialect}")
+
+def _assignments(table, incoming, update, increment):
+    values = {name: incoming(name) for name in update}
+    values.update({name: table.c[name] + incoming(name) for name in increment})
+    return values
+
+def _mysql(executor, table, rows, update, increment, only_if):
+    statement = mysql.insert(table).values(rows)
+    incoming = lambda name: statement.inserted[name]
+    values = _assignments(table, incoming, update, increment)
+
+    if not values:
+        return _mysql_insert_missing(executor, table, rows)
+
+    if only_if is not None:
+        # MySQL applies assignments left to right, so the guard must only read columns that are
+        # assigned after it is evaluated; callers list guarded columns last
+        condition = only_if(incoming)
+        values = {name: func.if_(condition, value, table.c[name]) for name, value in values.items()}
+
+    # affected rows: 1 per inserted row, 2 per changed row. Under the CLIENT_FOUND_ROWS flag the
+    # MySQL dialects set, a row the guard leaves unchanged also counts 1, so multi-row calls with
+    # only_if can report it as inserted
+    result = executor.execute(statement.on_duplicate_key_update(**values))
+    updated = max(result.rowcount - len(rows), 0)
+    return UpsertResult(result.rowcount - 2 * updated, updated)
+
+def _mysql_insert_missing(executor, table, rows):
+    # a no-op ON DUPLICATE KEY UPDATE would still count the row as found, and INSERT IGNORE also
+    # downgrades foreign key and truncation errors to warnings. A plain insert under a savepoint only
+    # treats duplicate keys as "not inserted"; a batch that hits one is retried a row at a time
+    try:
+        with executor.begin_nested():
+            executor.execute(mysql.insert(table), rows)
+        return UpsertResult(len(rows), 0)
+    except IntegrityError as e:
+        if not _duplicate_key(e):
+            raise
+    if len(rows) == 1:
+        return UpsertResult(0, 0)
+    return UpsertResult(sum(_mysql_insert_missing(executor, table, [row]).inserted for row in rows), 0)
+
+def _duplicate_key(error):
+    # mysqlclient and PyMySQL put the server error code first in args
+    return bool(error.orig.args) and error.orig.args[0] == MYSQL_DUPLICATE_KEY
+
+def _postgresql(executor, table, rows, keys, update, increment, only_if):
+    statement = postgresql.insert(table).values(rows)
+    incoming = lambda name: statement.excluded[name]
+    values = _assignments(table, incoming, update, increment)
+
+    if not values:
+        result = executor.execute(statement.on_conflict_do_nothing(index_elements=keys))
+        return UpsertResult(result.rowcount, 0)
+
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_=values,
+        where=only_if(incoming) if only_if is not None else None
+    ).returning(literal_column('xmax = 0'))
+    # xmax is only zero on a freshly inserted tuple
+    flags = executor.execute(statement).scalars().all()
+    inserted = sum(1 for flag in flags if flag)
+    return UpsertResult(inserted, len(flags) - inserted)
+
+def _coerce(column, value):
+    # RETURNING hands back the stored type, e.g. '1' for an int bound to a string column
+    python_type = column.type.python_type
+    return value if isinstance(value, python_type) else python_type(value)
+
+def _sqlite(executor, table, rows, keys, update, increment, only_if):
+    # SQLite's ON CONFLICT DO UPDATE can't tell an insert from an update, so the insert skips
+    # conflicts and returns the keys it wrote. The first write takes the database write lock, so
+    # no other connection can touch the conflicting rows before the update below runs
+    statement = sqlite.insert(table).values(rows).on_conflict_do_nothing(index_elements=keys)
+    written = set(executor.execute(statement.returning(*(table.c[k] for k in keys))).all())
+    key = lambda row: tuple(_coerce(table.c[k], row[k]) for k in keys)
+    conflicts = [row for row in rows if key(row) not in written]
+
+    incoming = lambda name: bindparam(f"new_{name}", type_=table.c[name].type)
+    values = _assignments(table, incoming, update, increment)
+    if not conflicts or not values:
+        return UpsertResult(len(written), 0)
+
+    statement = (
+        sql_update(table)
+        .where(*(table.c[k] == bindparam(f"key_{k}") for k in keys))
+        .values(values)
+    )
+    if only_if is not None:
+        statement = statement.where(only_if(incoming))
+
+    params = [
+        {**{f"key_{k}": row[k] for k in keys}, **{f"new_{name}": value for name, value in row.items()}}
+        for row in conflicts
+    ]
+    result = executor.execute(statement, params)
+    return UpsertResult(len(written), result.rowcount)
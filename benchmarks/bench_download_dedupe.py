@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import random
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text
+from app import create_app
+from app.models import db, Manga, Chapter, Download
+from app.utils.download_filter import download_filter
+from app.utils.upsert import upsert
+
+DOWNLOADS = int(os.environ.get('BENCH_DOWNLOADS', 500_000))
+USERS = 2000
+CHAPTERS = 20_000
+BATCH = 50_000
+REQUESTS = 5000
+REPEAT_RATE = 0.5
+
+def seed(rng):
+    db.session.execute(insert(Manga), [{
+        'id': 'm0', 'title': 'Manga', 'author': 'Author', 'status': 'Ongoing', 'cover_url': 'x',
+        'genre': 'Action', 'book_type': 'Manga', 'published_date': date(2020, 1, 1), 'rating': 4.0, 'views': 0
+    }])
+    db.session.execute(insert(Chapter), [
+        {'id': f"c{i:06d}", 'manga_id': 'm0', 'chapter_number': str(i), 'release_date': date(2024, 1, 1), 'language': 'en'}
+        for i in range(CHAPTERS)
+    ])
+    pairs = set()
+    while len(pairs) < DOWNLOADS:
+        pairs.add((rng.randrange(USERS) + 1, f"c{rng.randrange(CHAPTERS):06d}"))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), BATCH):
+        db.session.execute(insert(Download), [{'user_id': u, 'chapter_id': c} for u, c in pairs[start:start + BATCH]])
+    db.session.commit()
+    return pairs
+
+def workload(rng, pairs):
+    # half the requests repeat an existing download, the rest are new; users repeat like real sessions
+    users = [rng.randrange(USERS) + 1 for _ in range(50)]
+    requests = []
+    for _ in range(REQUESTS):
+        if rng.random() < REPEAT_RATE:
+            requests.append(rng.choice(pairs))
+        else:
+            requests.append((rng.choice(users), f"c{rng.randrange(CHAPTERS):06d}"))
+    return requests
+
+def select_then_insert(user_id, chapter_id):
+    # the previous create_download: existence scan, then an ORM insert
+    exists = db.session.execute(
+        select(Download).where((Download.chapter_id == chapter_id) & (Download.user_id == user_id))
+    ).scalar_one_or_none()
+    if exists:
+        return False
+    db.session.add(Download(user_id=user_id, chapter_id=chapter_id))
+    db.session.commit()
+    return True
+
+def filtered_upsert(user_id, chapter_id):
+    downloads = download_filter()
+    if downloads.contains(user_id, chapter_id):
+        return False
+    result = upsert(db.session, Download.__table__, {'user_id': user_id, 'chapter_id': chapter_id}, ['user_id', 'chapter_id'])
+    db.session.commit()
+    downloads.add(user_id, chapter_id)
+    return bool(result.inserted)
+
+def run(label, create, requests):
+    start = time.perf_counter()
+    created = sum(create(user_id, chapter_id) for user_id, chapter_id in requests)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {len(requests) / elapsed:9.0f} req/s  ({created} created)")
+
+def main():
+    app = create_app('TestingConfig')
+
+    with app.app_context():
+        rng = random.Random(7)
+        db.drop_all()
+        db.create_all()
+        db.session.execute(text("DROP INDEX ux_download_user_id_chapter_id"))
+        pairs = seed(rng)
+        requests = workload(rng, pairs)
+        print(f"seeded {DOWNLOADS} downloads, {REQUESTS} create requests, {REPEAT_RATE:.0%} repeats")
+
+        run('select+insert, no idx', select_then_insert, requests)
+
+        db.session.execute(text("DELETE FROM download WHERE id > :n"), {'n': DOWNLOADS})
+        db.session.commit()
+        next(index for index in Download.__table__.indexes if index.name == 'ux_download_user_id_chapter_id').create(db.engine)
+        run('filter+upsert, unique', filtered_upsert, requests)
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
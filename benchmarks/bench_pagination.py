@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import statistics
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from app import create_app
+from app.models import db, Manga
+from app.utils.pagination import encode_cursor
+
+TOTAL = int(os.environ.get('BENCH_MANGA', 100_050))
+PER_PAGE = 10
+DEEP_PAGE = 10_000
+RUNS = 20
+
+def seed():
+    rows = [{
+        'id': f"{i:08d}",
+        'title': f"Title {i}",
+        'author': f"Author {i % 500}",
+        'status': 'Ongoing',
+        'cover_url': 'https://example.com/cover.jpg',
+        'genre': 'Action',
+        'book_type': 'Manga',
+        'published_date': date(2020, 1, 1),
+        'rating': (i % 50) / 10,
+        'views': i % 10_000,
+        'description': 'Benchmark description'
+    } for i in range(TOTAL)]
+    db.session.execute(insert(Manga), rows)
+    db.session.commit()
+
+def timed(client, url):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(samples) * 1000
+
+def main():
+    app = create_app('BenchmarkConfig')
+    client = app.test_client()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        skip = (DEEP_PAGE - 1) * PER_PAGE - 1
+        last_id = db.session.execute(select(Manga.id).order_by(Manga.id).offset(skip).limit(1)).scalar_one()
+        deep_cursor = encode_cursor([last_id])
+
+    results = [
+        ('offset page 1', timed(client, f'/manga/?page=1&per_page={PER_PAGE}')),
+        (f'offset page {DEEP_PAGE}', timed(client, f'/manga/?page={DEEP_PAGE}&per_page={PER_PAGE}')),
+        ('cursor page 1', timed(client, f'/manga/?cursor=&per_page={PER_PAGE}')),
+        (f'cursor page {DEEP_PAGE}', timed(client, f'/manga/?cursor={deep_cursor}&per_page={PER_PAGE}')),
+    ]
+
+    print(f"{TOTAL} manga, per_page={PER_PAGE}, median of {RUNS} requests")
+    for name, ms in results:
+        print(f"  {name:<20} {ms:8.2f} ms")
+
+    with app.app_context():
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
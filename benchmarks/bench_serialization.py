@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import statistics
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert, select
+from app import create_app
+from app.models import db, Manga
+from app.blueprints.manga.schema import MangaSchema, mangas_schema
+from app.utils.serializers import row_serializer
+
+TOTAL = 1_000
+PER_PAGE = 100
+RUNS = 200
+
+def seed():
+    rows = [{
+        'id': f"{i:08d}",
+        'title': f"Title {i}",
+        'author': f"Author {i % 50}",
+        'status': 'Ongoing',
+        'cover_url': 'https://example.com/cover.jpg',
+        'genre': 'Action, Fantasy',
+        'book_type': 'Manga',
+        'published_date': date(2020, 1, 1),
+        'rating': (i % 50) / 10,
+        'views': i,
+        'description': 'Benchmark description ' * 40
+    } for i in range(TOTAL)]
+    db.session.execute(insert(Manga), rows)
+    db.session.commit()
+
+def orm_path(app, default_json):
+    mangas = db.session.execute(select(Manga).order_by(Manga.id).limit(PER_PAGE)).scalars().all()
+    body = default_json.dumps({'mangas': mangas_schema.dump(mangas)})
+    db.session.expunge_all()
+    return body
+
+def fast_path(app, serializer):
+    rows = db.session.execute(serializer.select().order_by(Manga.id).limit(PER_PAGE)).all()
+    return app.json.dumps({'mangas': serializer.dump(rows)})
+
+def timed(fn, *args):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    app = create_app('TestingConfig')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+
+        default_json = DefaultJSONProvider(app)
+        serializer = row_serializer(MangaSchema)
+        assert default_json.loads(orm_path(app, default_json)) == app.json.loads(fast_path(app, serializer))
+
+        orm_ms = timed(orm_path, app, default_json)
+        fast_ms = timed(fast_path, app, serializer)
+
+        print(f"/manga/ page of {PER_PAGE}, median of {RUNS} runs")
+        print(f"  ORM + SQLAlchemyAutoSchema + json  {orm_ms:8.2f} ms")
+        print(f"  Core rows + RowSerializer + orjson {fast_ms:8.2f} ms ({orm_ms / fast_ms:.1f}x)")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from app import create_app
-from app.models import db, User, Bookmark
+from app.models import db, User, Bookmark, Manga, Chapter, ReadingHistory, manga_chapter_count
+from app.utils.upsert import upsert
+from datetime import date, datetime
+from sqlalchemy import select, text, event
+from app.utils.pagination import parse_sort, order_by_clauses
+from app.blueprints.bookmarks.routes import SORTABLE_COLUMNS
 from werkzeug.security import generate_password_hash
 from app.utils.util import encode_token
 
@@ -166,4 +172,247 @@ class BookmarkRouteTests(unittest.TestCase):
             headers={"Authorization": f"Bearer {self.other_token}"}
         )
         self.assertEqual(response.status_code, 403)
-        self.assertIn("Forbidden", response.get_data(as_text=True))
\ No newline at end of file
+        self.assertIn("Forbidden", response.get_data(as_text=True))
+        
+    def test_get_all_bookmark_cursor(self):
+        response = self.client.get('/bookmarks/?cursor=&per_page=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['bookmarks']), 1)
+        self.assertIsNone(response.get_json()['next_cursor'])
+        
+    def test_get_my_bookmarks_sparse_fields(self):
+        response = self.client.get(
+            "/bookmarks/user?fields=manga_id,favorited",
+            headers={"Authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['bookmarks'], [{'manga_id': '1', 'favorited': False}])
+        
+    def _add_manga_with_chapters(self, manga_id, numbers, language='en'):
+        with self.app.app_context():
+            if db.session.get(Manga, manga_id) is None:
+                db.session.add(Manga(id=manga_id, title=f"Manga {manga_id}", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=date(2025, 1, 1), rating=1, views=1))
+            for number in numbers:
+                db.session.add(Chapter(id=f"{manga_id}-{language}-{number}", manga_id=manga_id, chapter_number=str(number), release_date=datetime(2025, 1, number), language=language))
+            db.session.commit()
+            
+    def test_unread_counts(self):
+        self._add_manga_with_chapters('1', range(1, 6))
+        self._add_manga_with_chapters('1', range(1, 3), language='fr')
+        self._add_manga_with_chapters('2', range(1, 4))
+        self._add_manga_with_chapters('3', range(1, 5))
+        with self.app.app_context():
+            db.session.add(ReadingHistory(user_id=self.user_id, manga_id='1', last_chapter='1-en-3'))
+            db.session.add(Bookmark(user_id=self.user_id, manga_id='2'))
+            db.session.add(Bookmark(user_id=self.user_id, manga_id='3', last_read_chapter='4'))
+            db.session.add(Bookmark(user_id=self.other_user_id, manga_id='2'))
+            db.session.commit()
+            
+        response = self.client.get('/bookmarks/user/unread', headers={"Authorization": f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(u['manga_id'], u['language'], u['total_chapters'], u['unread']) for u in response.json['unread']],
+            [('1', 'en', 5, 2), ('2', 'en', 3, 2), ('3', 'en', 4, 0)]
+        )
+        
+    def test_unread_counts_follow_synced_chapter_number(self):
+        self._add_manga_with_chapters('4', range(1, 6))
+        self._add_manga_with_chapters('4', range(1, 6), language='fr')
+        self._statements('/bookmarks/sync', method='post', json={'operations': [{'op': 'read', 'manga_id': '4', 'last_read_chapter': '4'}]})
+        
+        response, _ = self._statements('/bookmarks/user/unread')
+        unread = {u['manga_id']: (u['language'], u['unread']) for u in response.json['unread']}
+        self.assertEqual(unread['4'], ('en', 1))
+        response, _ = self._statements('/bookmarks/user/unread?language=fr')
+        unread = {u['manga_id']: (u['language'], u['unread']) for u in response.json['unread']}
+        self.assertEqual(unread['4'], ('fr', 1))
+        
+    def test_chapter_counts_follow_chapter_writes(self):
+        self._add_manga_with_chapters('1', range(1, 4))
+        with self.app.app_context():
+            db.session.delete(db.session.get(Chapter, '1-en-2'))
+            chapter = db.session.get(Chapter, '1-en-3')
+            chapter.language = 'fr'
+            db.session.commit()
+            
+            counts = dict(((row.manga_id, row.language), row.chapter_count) for row in db.session.execute(manga_chapter_count.select()))
+            self.assertEqual(counts, {('1', 'en'): 1, ('1', 'fr'): 1})
+            
+            db.session.execute(manga_chapter_count.delete())
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['rebuild-chapter-counts'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            self.assertEqual(len(db.session.execute(manga_chapter_count.select()).all()), 2)
+
+        
+    def _library(self, size):
+        with self.app.app_context():
+            for i in range(size):
+                manga_id = f"lib-{i}"
+                db.session.add(Manga(id=manga_id, title=f"Library {i}", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=date(2025, 1, 1), rating=1, views=1))
+                db.session.add(Bookmark(user_id=self.user_id, manga_id=manga_id, favorited=i % 2 == 0, added_at=datetime(2025, 1, 1 + i % 28), last_updated=datetime(2025, 2, 1 + i) if i < 3 else None))
+            db.session.commit()
+            
+    def _statements(self, url, method='get', **kwargs):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        response = getattr(self.client, method)(url, headers={"Authorization": f"Bearer {self.token}"}, **kwargs)
+        response.get_data()
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return response, statements
+        
+    def _count_queries(self, url):
+        response, statements = self._statements(url)
+        return response, len(statements)
+        
+    def test_get_my_bookmarks_expand_manga_constant_queries(self):
+        self._library(3)
+        response, small = self._count_queries('/bookmarks/user?expand=manga')
+        self.assertEqual(response.json['bookmarks'][1]['manga']['title'], "Library 0")
+        self.assertIsNone(response.json['bookmarks'][0]['manga'])
+        
+        self._library(0)
+        with self.app.app_context():
+            for i in range(3, 40):
+                db.session.add(Manga(id=f"lib-{i}", title=f"Library {i}", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=date(2025, 1, 1), rating=1, views=1))
+                db.session.add(Bookmark(user_id=self.user_id, manga_id=f"lib-{i}"))
+            db.session.commit()
+        response, large = self._count_queries('/bookmarks/user?expand=manga')
+        self.assertEqual(len(response.json['bookmarks']), 41)
+        self.assertEqual(small, large)
+        self.assertEqual(large, 2)
+        
+    def test_get_my_bookmarks_filtered_sorted_and_paged(self):
+        self._library(5)
+        response, _ = self._count_queries('/bookmarks/user?favorited=true&sort=-added_at')
+        self.assertEqual([b['manga_id'] for b in response.json['bookmarks']], ['lib-4', 'lib-2', 'lib-0'])
+        
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response, _ = self._count_queries(f'/bookmarks/user?sort=-last_updated&per_page=2&cursor={cursor}')
+            seen.extend(b['manga_id'] for b in response.json['bookmarks'])
+            cursor = response.json['next_cursor']
+        self.assertEqual(seen[:3], ['lib-2', 'lib-1', 'lib-0'])
+        self.assertEqual(len(seen), 6)
+        
+        response, _ = self._count_queries('/bookmarks/user?sort=title')
+        self.assertEqual(response.status_code, 400)
+        response, _ = self._count_queries('/bookmarks/user?expand=user')
+        self.assertEqual(response.status_code, 400)
+        
+    def test_bookmark_sorts_use_user_indexes(self):
+        with self.app.app_context():
+            for sort, index in [('-added_at', 'ix_bookmark_user_id_added_at_id'), ('last_updated', 'ix_bookmark_user_id_last_updated_id')]:
+                order = parse_sort(sort, SORTABLE_COLUMNS, Bookmark.id)
+                query = select(Bookmark).where(Bookmark.user_id == self.user_id).order_by(*order_by_clauses(order)).limit(10)
+                sql = str(query.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                plan = ' '.join(row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+                
+                self.assertIn(f"USING INDEX {index}", plan)
+                self.assertNotIn("TEMP B-TREE", plan)
+                
+    def test_sync_collapses_operations_per_manga(self):
+        self._library(2)
+        with self.app.app_context():
+            db.session.add_all([
+                Manga(id=manga_id, title=manga_id, author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=date(2025, 1, 1), rating=1, views=1)
+                for manga_id in ('new', 'gone')
+            ])
+            db.session.commit()
+        operations = [
+            {'op': 'add', 'manga_id': 'new', 'favorited': True},
+            {'op': 'read', 'manga_id': 'new', 'last_read_chapter': 'Chapter 4'},
+            {'op': 'remove', 'manga_id': '1'},
+            {'op': 'favorite', 'manga_id': 'lib-0'},
+            {'op': 'favorite', 'manga_id': 'lib-1'},
+            {'op': 'read', 'manga_id': 'lib-1', 'last_read_chapter': 'Chapter 9'},
+            {'op': 'remove', 'manga_id': 'gone'},
+            {'op': 'add', 'manga_id': 'gone'},
+            {'op': 'remove', 'manga_id': 'gone'},
+        ] + [{'op': 'read', 'manga_id': 'new', 'last_read_chapter': f"Chapter {n}"} for n in range(5, 50)]
+        response, statements = self._statements('/bookmarks/sync', method='post', json={'operations': operations})
+        self.assertEqual(response.status_code, 200, response.json)
+        
+        self.assertEqual((response.json['added'], response.json['updated'], response.json['removed']), (1, 2, 1))
+        library = {b['manga_id']: (b['favorited'], b['last_read_chapter']) for b in response.json['bookmarks']}
+        self.assertEqual(library, {
+            'lib-0': (False, '1'),
+            'lib-1': (True, 'Chapter 9'),
+            'new': (True, 'Chapter 49'),
+        })
+        writes = [s for s in statements if s.split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(len(writes), 3)
+        
+    def test_sync_adds_bookmark_created_concurrently(self):
+        self._library(1)
+        # the row already exists, as when add_bookmark or another sync commits first
+        response, _ = self._statements('/bookmarks/sync', method='post', json={'operations': [
+            {'op': 'add', 'manga_id': 'lib-0', 'favorited': False},
+            {'op': 'read', 'manga_id': 'lib-0', 'last_read_chapter': 'Chapter 2'},
+        ]})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual((response.json['added'], response.json['updated']), (0, 1))
+        self.assertEqual([(b['favorited'], b['last_read_chapter']) for b in response.json['bookmarks'] if b['manga_id'] == 'lib-0'], [(False, 'Chapter 2')])
+        
+    def test_sync_rejects_unknown_manga(self):
+        response, _ = self._statements('/bookmarks/sync', method='post', json={'operations': [
+            {'op': 'add', 'manga_id': 'missing'},
+            {'op': 'remove', 'manga_id': 'also-missing'},
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json['manga_ids'], ['missing'])
+        
+    def test_sync_rejects_invalid_operations(self):
+        response, _ = self._statements('/bookmarks/sync', method='post', json={'operations': [
+            {'op': 'add', 'manga_id': '2'},
+            {'op': 'rename', 'manga_id': '2'},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json['errors'])
+        
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Bookmark).count(), 1)
+            
+    def test_upsert_reports_inserted_and_updated(self):
+        with self.app.app_context():
+            table = ReadingHistory.__table__
+            rows = [{'user_id': self.user_id, 'manga_id': m, 'last_chapter': 'a', 'last_read_at': datetime(2025, 1, 2)} for m in ('1', '2')]
+            self.assertEqual(upsert(db.session, table, rows, ['user_id', 'manga_id'], update=['last_chapter']), (2, 0))
+            
+            rows = [dict(row, last_chapter='b') for row in rows] + [{'user_id': self.user_id, 'manga_id': '3', 'last_chapter': 'b', 'last_read_at': datetime(2025, 1, 2)}]
+            self.assertEqual(upsert(db.session, table, rows, ['user_id', 'manga_id'], update=['last_chapter']), (1, 2))
+            
+            stale = {'user_id': self.user_id, 'manga_id': '1', 'last_chapter': 'old', 'last_read_at': datetime(2025, 1, 1)}
+            guard = lambda incoming: table.c.last_read_at <= incoming('last_read_at')
+            self.assertEqual(upsert(db.session, table, stale, ['user_id', 'manga_id'], update=['last_chapter'], only_if=guard), (0, 0))
+            self.assertEqual(upsert(db.session, Bookmark.__table__, {'user_id': self.user_id, 'manga_id': '1'}, ['user_id', 'manga_id']), (0, 0))
+            db.session.commit()
+            
+            chapters = dict(db.session.execute(select(table.c.manga_id, table.c.last_chapter)).all())
+            self.assertEqual(chapters, {'1': 'b', '2': 'b', '3': 'b'})
+            
+    def test_concurrent_writes_to_one_pair(self):
+        def hammer(i):
+            client = self.app.test_client()
+            headers = {"Authorization": f"Bearer {self.token}"}
+            return (
+                client.post('/bookmarks/', json={'manga_id': '9'}, headers=headers).status_code,
+                client.put(f'/history/user/{self.user_id}', json={'manga_id': '9', 'last_chapter': f"Chapter {i}"}, headers=headers).status_code
+            )
+            
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(hammer, range(40)))
+            
+        bookmark_codes = sorted(code for code, _ in results)
+        history_codes = sorted(code for _, code in results)
+        self.assertEqual(bookmark_codes, [201] + [409] * 39)
+        self.assertEqual(history_codes, [200] * 39 + [201])
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Bookmark).filter_by(manga_id='9').count(), 1)
+            self.assertEqual(db.session.query(ReadingHistory).filter_by(manga_id='9').count(), 1)
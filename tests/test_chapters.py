@@ -1,10 +1,20 @@
 import unittest
 from app import create_app
-from app.models import db, Chapter, Manga, User
+from app.models import db, Chapter, Manga, User, ReadingHistory, ReadingEvent, chapter_sort_key, chapter_trigram, daily_manga_reads
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
+import time
 from app.utils.util import encode_token
+from app.utils.serializers import row_serializer
+from sqlalchemy import select, delete, event
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+from app.blueprints.chapters.schema import ChapterSchema, chapter_schema
+from app.blueprints.chapters.routes import adjacent_chapter, get_chapters_by_manga_id
+from app.utils.navigation import ChapterNavigation
+from app.utils.history import HistoryRecorder
+from app.utils.latest import LatestChapters
 
 class ChapterRouteTests(unittest.TestCase):
     
@@ -148,21 +158,21 @@ class ChapterRouteTests(unittest.TestCase):
         response = self.client.get('/chapter/search?title=Test')
         self.assertEqual(response.status_code, 200)
         data = response.get_json()
-        self.assertTrue(any("Test" in chapter['title'] for chapter in data))
+        self.assertTrue(any("Test" in chapter['title'] for chapter in data['chapters']))
     
     def test_search_chapter_by_language(self):
         response = self.client.get('/chapter/search?language=en')
         self.assertEqual(response.status_code, 200)
         data = response.get_json()
-        self.assertTrue(all(ch['language'] == 'en' for ch in data))
+        self.assertTrue(all(ch['language'] == 'en' for ch in data['chapters']))
         
     def test_get_chapters_by_manga_id(self):
         response = self.client.get(f'/chapter/manga/{self.manga_id}')
         self.assertEqual(response.status_code, 200)
         data = response.get_json()
-        self.assertIsInstance(data, list)
-        self.assertTrue(all(ch['manga_id'] == self.manga_id for ch in data))
-        self.assertGreaterEqual(len(data), 1)
+        self.assertIsInstance(data['chapters'], list)
+        self.assertTrue(all(ch['manga_id'] == str(self.manga_id) for ch in data['chapters']))
+        self.assertGreaterEqual(len(data['chapters']), 1)
     
     def test_update_chapter_by_id(self):
         update_payload = {
@@ -187,4 +197,537 @@ class ChapterRouteTests(unittest.TestCase):
             headers={'Authorization': f"Bearer {self.token}"}
         )
         self.assertEqual(response.status_code, 200)
-        self.assertIn('message', response.json)
\ No newline at end of file
+        self.assertIn('message', response.json)
+        
+    def test_chapter_list_cache_invalidated_on_create(self):
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        self.assertEqual(len(response.json['chapters']), 1)
+        
+        payload = {
+            "manga_id": 1,
+            "chapter_number": "Chapter 2",
+            "title": "Second",
+            "release_date": "2025-06-08",
+            "language": "en"
+        }
+        self.client.post("/chapter/", json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        self.assertEqual(len(response.json['chapters']), 2)
+        
+    def test_get_chapters_by_manga_id_conditional_get(self):
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        etag = response.headers['ETag']
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        self.client.put(
+            f'/chapter/{self.chapter_id}',
+            json={"chapter_number": "chapter 1", "title": "Renamed", "release_date": "2025-06-09", "language": "en", "manga_id": 1},
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        
+    def test_chapter_listing_validators_follow_writes_made_elsewhere(self):
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        
+        with self.app.app_context():
+            # another worker: neither this process's tags nor its response cache are invalidated
+            db.session.get(Chapter, self.chapter_id).chapter_number = "chapter 1.5"
+            db.session.commit()
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['chapters'][0]['chapter_number'], "chapter 1.5")
+        etag = response.headers['ETag']
+        
+        with self.app.app_context():
+            db.session.execute(Chapter.__table__.update().values(sort_key=None))
+            db.session.commit()
+        self.app.test_cli_runner().invoke(args=['backfill-sort-keys'])
+        response = self.client.get(f'/chapter/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['chapters'][0]['sort_key'], 1.5)
+        
+    def test_chapter_listing_of_manga_without_chapters(self):
+        other = Manga(id=2, title="Other", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=datetime.today().date(), rating=1, views=1)
+        with self.app.app_context():
+            db.session.add(other)
+            db.session.commit()
+        self.assertEqual(self.client.get('/chapter/manga/2').status_code, 404)
+        self.assertEqual(self.client.get(f'/chapter/manga/{self.manga_id}?language=fr').json['chapters'], [])
+        
+    def test_row_serializer_matches_schema(self):
+        with self.app.app_context():
+            serializer = row_serializer(ChapterSchema)
+            row = db.session.execute(serializer.select()).one()
+            chapter = db.session.get(Chapter, self.chapter_id)
+            
+            self.assertEqual(serializer.serialize(row), chapter_schema.dump(chapter))
+
+            
+    def test_export_chapters_resumes_after_token(self):
+        with self.app.app_context():
+            db.session.add(Chapter(id='zzz', chapter_number='chapter 2', title='Later', release_date=datetime(2025, 6, 8).date(), language='en', manga_id=self.manga_id))
+            db.session.commit()
+        
+        response = self.client.get('/chapter/export?batch_size=1')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['chapter', 'checkpoint', 'chapter', 'checkpoint', 'end'])
+        self.assertEqual(lines[0]['manga_id'], '1')
+        
+        response = self.client.get(f"/chapter/export?resume_token={lines[1]['resume_token']}")
+        resumed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['id'] for line in resumed if line['type'] == 'chapter'], ['zzz'])
+
+            
+    def _add_chapters(self, *numbers, language='en'):
+        ids = {}
+        with self.app.app_context():
+            for number in numbers:
+                chapter = Chapter(chapter_number=number, title=number, release_date=datetime(2025, 6, 7), language=language, manga_id=self.manga_id)
+                db.session.add(chapter)
+                db.session.flush()
+                ids[number] = chapter.id
+            db.session.commit()
+        return ids
+        
+    def test_chapter_sort_key(self):
+        self.assertEqual(chapter_sort_key("10.5"), 10.5)
+        self.assertEqual(chapter_sort_key("Chapter 12"), 12)
+        self.assertEqual(chapter_sort_key("Vol.2 Ch.3"), 3)
+        self.assertGreater(chapter_sort_key("Extra"), chapter_sort_key("999"))
+        
+    def test_next_and_previous_follow_sort_key_on_same_release_date(self):
+        ids = self._add_chapters("10", "2", "2.5", "Extra")
+        self._add_chapters("3", language="fr")
+        
+        response = self.client.get(f"/chapter/{ids['2']}/next")
+        self.assertEqual(response.json['chapter_number'], "2.5")
+        response = self.client.get(f"/chapter/{ids['2.5']}/next")
+        self.assertEqual(response.json['chapter_number'], "10")
+        response = self.client.get(f"/chapter/{ids['10']}/previous")
+        self.assertEqual(response.json['chapter_number'], "2.5")
+        response = self.client.get(f"/chapter/{ids['Extra']}/next")
+        self.assertEqual(response.json, {'message': 'No next chapter'})
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        self.assertEqual([c['chapter_number'] for c in response.json['chapters']], ["chapter 1", "2", "2.5", "10", "Extra", "3"])
+        
+    def test_adjacent_chapter_uses_index_range_scan(self):
+        with self.app.app_context():
+            chapter = db.session.get(Chapter, self.chapter_id)
+            statements = []
+            listener = lambda conn, cursor, statement, params, context, many: statements.append((statement, params))
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            adjacent_chapter(chapter)
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            
+            statement, params = statements[-1]
+            plan = ' '.join(row[3] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params))
+            self.assertIn("ix_chapter_manga_listing", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+        
+    def test_backfill_sort_keys_command(self):
+        with self.app.app_context():
+            db.session.execute(Chapter.__table__.update().values(sort_key=None))
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['backfill-sort-keys'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Chapter, self.chapter_id).sort_key, 1.0)
+        
+    def test_chapter_nav(self):
+        ids = self._add_chapters("2", "3")
+        
+        response = self.client.get(f"/chapter/{ids['2']}/nav")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {
+            'chapter_id': ids['2'],
+            'manga_id': '1',
+            'language': 'en',
+            'position': 2,
+            'total': 3,
+            'first': self.chapter_id,
+            'previous': self.chapter_id,
+            'next': ids['3'],
+            'last': ids['3']
+        })
+        self.assertEqual(self.client.get('/chapter/missing/nav').status_code, 404)
+        
+    def test_chapter_nav_served_from_memory_until_chapters_change(self):
+        ids = self._add_chapters("3")
+        self.client.get(f'/chapter/{self.chapter_id}/nav')
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append((statement, args[0]))
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        response = self.client.get(f"/chapter/{ids['3']}/nav")
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.json['previous'], self.chapter_id)
+        # only the stamp is read, from its covering index
+        self.assertEqual(len(statements), 1)
+        with self.app.app_context():
+            plan = ' '.join(row[3] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statements[0][0]}", statements[0][1]))
+            self.assertIn("USING COVERING INDEX ix_chapter_manga_stamp", plan)
+        
+        payload = {"manga_id": 1, "chapter_number": "2", "title": "Two", "release_date": "2025-06-08", "language": "en"}
+        self.client.post("/chapter/", json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        response = self.client.get(f"/chapter/{ids['3']}/nav")
+        self.assertEqual(response.json['total'], 3)
+        
+    def test_chapter_nav_sees_writes_made_elsewhere(self):
+        ids = self._add_chapters("2", "3")
+        self.assertEqual(self.client.get(f"/chapter/{ids['3']}/nav").json['previous'], ids['2'])
+        
+        with self.app.app_context():
+            # a CLI command or another worker: no tag of this process is invalidated
+            db.session.execute(delete(Chapter).where(Chapter.id == ids['2']))
+            db.session.commit()
+        
+        response = self.client.get(f"/chapter/{ids['3']}/nav")
+        self.assertEqual((response.json['previous'], response.json['total']), (self.chapter_id, 2))
+        
+    def test_chapter_navigation_evicts_least_recently_used(self):
+        other = Manga(id=2, title="Other", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=datetime.today().date(), rating=1, views=1)
+        with self.app.app_context():
+            db.session.add(other)
+            db.session.add(Chapter(id='other-1', chapter_number='1', release_date=datetime(2025, 1, 1), language='en', manga_id='2'))
+            db.session.commit()
+            
+            navigation = ChapterNavigation(max_mangas=1)
+            self.assertEqual(navigation.nav(self.chapter_id)['total'], 1)
+            self.assertEqual(navigation.nav('other-1')['manga_id'], '2')
+            self.assertEqual(list(navigation.mangas), ['2'])
+            self.assertNotIn(self.chapter_id, navigation.owners)
+        
+    def test_trigram_postings_compare_binary_on_mysql(self):
+        # "café" and "cafe" give distinct trigrams that MySQL's default collation would treat as equal
+        ddl = str(CreateTable(chapter_trigram).compile(dialect=mysql.dialect()))
+        self.assertIn("trigram VARCHAR(3) COLLATE utf8mb4_bin NOT NULL", ddl)
+        
+    def test_search_chapter_titles_ranked_and_paged(self):
+        with self.app.app_context():
+            for i, title in enumerate(["The Dragon Awakens", "Dragon", "Return of the Dragon King", "Unrelated"]):
+                db.session.add(Chapter(id=f'c{i}', chapter_number=str(i + 2), title=title, release_date=datetime(2025, 1, 1), language='fr' if i == 2 else 'en', manga_id=self.manga_id))
+            db.session.commit()
+        
+        response = self.client.get('/chapter/search?title=dragon&per_page=2')
+        self.assertEqual(response.json['total_results'], 3)
+        self.assertEqual([c['title'] for c in response.json['chapters']], ["Dragon", "The Dragon Awakens"])
+        response = self.client.get('/chapter/search?title=dragon&per_page=2&page=2')
+        self.assertEqual([c['title'] for c in response.json['chapters']], ["Return of the Dragon King"])
+        
+        response = self.client.get('/chapter/search?title=dragn')
+        self.assertEqual(response.json['chapters'][0]['title'], "Dragon")
+        response = self.client.get('/chapter/search?title=dragon&language=fr')
+        self.assertEqual([c['id'] for c in response.json['chapters']], ['c2'])
+        response = self.client.get('/chapter/search?title=dragon&manga_id=2')
+        self.assertEqual(response.json['total_results'], 0)
+        
+    def _add_uuid_manga(self, *chapters):
+        # real manga get a uuid id, which every chapter endpoint must dump as a string
+        with self.app.app_context():
+            manga = Manga(title="Uuid Manga", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=datetime.today().date(), rating=1, views=1)
+            db.session.add(manga)
+            db.session.flush()
+            for chapter_id, title, day in chapters:
+                db.session.add(Chapter(id=chapter_id, chapter_number=chapter_id, title=title, release_date=datetime(2025, 8, day), language='en', manga_id=manga.id))
+            db.session.commit()
+            return manga.id
+        
+    def test_search_chapter_of_uuid_manga(self):
+        manga_id = self._add_uuid_manga(('u1', "Hello World", 1))
+        
+        response = self.client.get('/chapter/search?title=hello')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(c['id'], c['manga_id']) for c in response.json['chapters']], [('u1', manga_id)])
+        
+    def test_search_chapter_index_follows_updates_and_deletes(self):
+        self.client.put(f'/chapter/{self.chapter_id}', json={"manga_id": 1, "chapter_number": "chapter 1", "title": "Renamed", "release_date": "2025-06-07", "language": "en"}, headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(self.client.get('/chapter/search?title=Test').json['total_results'], 0)
+        self.assertEqual(self.client.get('/chapter/search?title=renamed').json['total_results'], 1)
+        
+        self.client.delete(f'/chapter/{self.chapter_id}', headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(self.client.get('/chapter/search?title=renamed').json['total_results'], 0)
+        
+    def test_rebuild_chapter_trigrams_command(self):
+        with self.app.app_context():
+            db.session.execute(chapter_trigram.delete())
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['rebuild-chapter-trigrams'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.client.get('/chapter/search?title=test').json['total_results'], 1)
+        
+    def test_get_chapter_records_reading_history(self):
+        token = encode_token(user_id=self.user_id, role='user')
+        self.client.get(f'/chapter/{self.chapter_id}', headers={"Authorization": f"Bearer {token}"})
+        
+        with self.app.app_context():
+            history = db.session.execute(select(ReadingHistory)).scalar_one()
+            self.assertEqual((history.user_id, history.manga_id, history.last_chapter), (self.user_id, '1', self.chapter_id))
+        
+    def test_history_recorder_coalesces_reads_per_manga(self):
+        ids = self._add_chapters("2", "3")
+        recorder = HistoryRecorder(self.app, flush_interval=60)
+        
+        recorder.record(self.user_id, '1', self.chapter_id, datetime(2025, 1, 1, 10))
+        recorder.record(self.user_id, '1', ids['3'], datetime(2025, 1, 1, 12))
+        recorder.record(self.user_id, '1', ids['2'], datetime(2025, 1, 1, 11))
+        self.assertEqual(len(recorder.pending), 1)
+        self.assertEqual(recorder.flush(), 1)
+        
+        recorder.record(self.user_id, '1', ids['2'], datetime(2025, 1, 1, 9))
+        recorder.stop()
+        
+        with self.app.app_context():
+            history = db.session.execute(select(ReadingHistory)).scalar_one()
+            self.assertEqual(history.last_chapter, ids['3'])
+            
+    def test_history_recorder_drops_rows_that_cannot_be_written(self):
+        recorder = HistoryRecorder(self.app, synchronous=True)
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            # a NOT NULL violation stands in for a foreign key to a deleted user
+            recorder.record(self.user_id, None, self.chapter_id)
+        self.assertIn('Dropping reading history', logs.output[0])
+        self.assertEqual((recorder.pending, recorder.events), ({}, []))
+        
+        # in a batch only the failing (user, manga) is dropped
+        recorder = HistoryRecorder(self.app, flush_interval=60)
+        recorder.record(self.user_id, '1', self.chapter_id)
+        recorder.record(self.user_id + 1, None, self.chapter_id)
+        with self.assertLogs(self.app.logger, 'WARNING'):
+            recorder.stop()
+        with self.app.app_context():
+            self.assertEqual(db.session.query(ReadingHistory).count(), 1)
+            self.assertEqual(db.session.query(ReadingEvent).count(), 1)
+        
+    def test_history_recorder_flushes_in_background_when_full(self):
+        recorder = HistoryRecorder(self.app, max_pending=2, flush_interval=60)
+        recorder.record(self.user_id, '1', self.chapter_id)
+        recorder.record(self.user_id + 1, '1', self.chapter_id)
+        
+        for _ in range(100):
+            if not recorder.pending:
+                break
+            time.sleep(0.05)
+        recorder.stop()
+        
+        with self.app.app_context():
+            self.assertEqual(db.session.query(ReadingHistory).count(), 2)
+        
+    def test_reading_events_roll_up_into_daily_counts(self):
+        ids = self._add_chapters("2", "3")
+        recorder = HistoryRecorder(self.app, flush_interval=60)
+        for chapter_id, read_at in [(self.chapter_id, datetime(2025, 3, 1, 9)), (ids['2'], datetime(2025, 3, 1, 10)), (ids['3'], datetime(2025, 3, 2, 8))]:
+            recorder.record(self.user_id, '1', chapter_id, read_at)
+        recorder.record(self.user_id + 1, '1', ids['2'], datetime(2025, 3, 2, 9))
+        recorder.stop()
+        
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['rollup-reading-events', '--batch-size', '3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Rolled up 4 reading events", result.output)
+        
+        recorder.record(self.user_id, '1', ids['3'], datetime(2025, 3, 2, 10))
+        recorder.stop()
+        runner.invoke(args=['rollup-reading-events'])
+        
+        with self.app.app_context():
+            counts = db.session.execute(select(daily_manga_reads.c.day, daily_manga_reads.c.reads).order_by(daily_manga_reads.c.day)).all()
+            self.assertEqual([(day.day, reads) for day, reads in counts], [(1, 2), (2, 3)])
+            
+        response = self.client.get('/history/admin/analytics/users?start=2025-03-02&end=2025-03-02', headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_reads'], 3)
+        self.assertEqual([(d['user_id'], d['reads']) for d in response.json['daily']], [(self.user_id, 2), (self.user_id + 1, 1)])
+        response = self.client.get('/history/admin/analytics/manga?start=March', headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 400)
+        
+        with self.app.app_context():
+            db.session.add(ReadingEvent(user_id=self.user_id, manga_id='1', chapter_id=self.chapter_id, read_at=datetime(2025, 3, 3)))
+            db.session.commit()
+        result = runner.invoke(args=['prune-reading-events', '--days', '0', '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            # the event added after the last rollup is kept until it is folded in
+            self.assertEqual(db.session.query(ReadingEvent).count(), 1)
+        
+    def test_rollup_waits_for_recent_events(self):
+        now = datetime.now(timezone.utc)
+        with self.app.app_context():
+            db.session.add_all([
+                ReadingEvent(user_id=self.user_id, manga_id='1', chapter_id=self.chapter_id, read_at=datetime(2025, 3, 1), recorded_at=recorded_at)
+                for recorded_at in [now - timedelta(minutes=10), now, now - timedelta(minutes=10)]
+            ])
+            db.session.commit()
+
+        # the second event is still inside the lag, so the third is held back behind it
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['rollup-reading-events', '--lag', '60'])
+        self.assertIn("Rolled up 1 reading events", result.output)
+        result = runner.invoke(args=['prune-reading-events', '--days', '0'])
+        self.assertIn("Pruned 1 reading events", result.output)
+
+        result = runner.invoke(args=['rollup-reading-events'])
+        self.assertIn("Rolled up 2 reading events", result.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(select(daily_manga_reads.c.reads)).scalar_one(), 3)
+
+    def _add_releases(self, *releases):
+        with self.app.app_context():
+            for chapter_id, day, language in releases:
+                db.session.add(Chapter(id=chapter_id, chapter_number=chapter_id, release_date=datetime(2025, 7, day), language=language, manga_id=self.manga_id))
+            db.session.commit()
+            
+    def test_latest_chapters_grouped_and_filtered(self):
+        self._add_releases(('a', 1, 'en'), ('b', 2, 'fr'), ('c', 3, 'en'))
+        
+        response = self.client.get('/chapter/latest?per_page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['manga'][0]['manga_id'], '1')
+        self.assertEqual([c['id'] for c in response.json['manga'][0]['chapters']], ['c', 'b'])
+        
+        response = self.client.get(f"/chapter/latest?per_page=2&cursor={response.json['next_cursor']}")
+        self.assertEqual([c['id'] for c in response.json['manga'][0]['chapters']], ['a', self.chapter_id])
+        self.assertIsNone(response.json['next_cursor'])
+        
+        response = self.client.get('/chapter/latest?language=fr')
+        self.assertEqual([c['id'] for c in response.json['manga'][0]['chapters']], ['b'])
+        self.assertEqual(self.client.get('/chapter/latest?cursor=bad').status_code, 400)
+        
+    def test_latest_chapters_of_uuid_manga(self):
+        manga_id = self._add_uuid_manga(('u1', "One", 1), ('u2', "Two", 2))
+        
+        response = self.client.get('/chapter/latest?per_page=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['manga'], [{'manga_id': manga_id, 'chapters': [response.json['manga'][0]['chapters'][0]]}])
+        
+        with self.app.test_request_context():
+            chapters, _ = LatestChapters(capacity=1).page(1, cursor=response.json['next_cursor'])
+        self.assertEqual([(c['id'], c['manga_id']) for c in chapters], [('u1', manga_id)])
+        
+    def test_latest_chapters_published_without_reload(self):
+        self.client.get('/chapter/latest')
+        payload = {"manga_id": 1, "chapter_number": "9", "title": "New", "release_date": "2025-08-01T00:00:00", "language": "en"}
+        self.client.post('/chapter/', json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        response = self.client.get('/chapter/latest?per_page=1')
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        self.assertEqual(response.json['manga'][0]['chapters'][0]['title'], "New")
+        # only the newest release is read back, to notice chapters added elsewhere
+        self.assertEqual(len(statements), 1)
+        self.assertIn('LIMIT', statements[0])
+        
+        self.client.delete(f"/chapter/{response.json['manga'][0]['chapters'][0]['id']}", headers={'Authorization': f"Bearer {self.token}"})
+        response = self.client.get('/chapter/latest?per_page=1')
+        self.assertEqual(response.json['manga'][0]['chapters'][0]['id'], self.chapter_id)
+        
+    def test_latest_chapters_see_releases_made_elsewhere(self):
+        self.client.get('/chapter/latest')
+        # an import from the CLI or another worker: this process's tag is never invalidated
+        self._add_releases(('elsewhere', 30, 'en'))
+        
+        response = self.client.get('/chapter/latest?per_page=1')
+        self.assertEqual(response.json['manga'][0]['chapters'][0]['id'], 'elsewhere')
+        
+    def test_latest_chapters_fall_back_to_index_past_buffer(self):
+        self._add_releases(('a', 1, 'en'), ('b', 2, 'en'), ('c', 3, 'en'))
+        with self.app.test_request_context():
+            latest = LatestChapters(capacity=2)
+            chapters, cursor = latest.page(2)
+            self.assertEqual([c['id'] for c in chapters], ['c', 'b'])
+            chapters, cursor = latest.page(2, cursor)
+            self.assertEqual([c['id'] for c in chapters], ['a', self.chapter_id])
+            self.assertIsNone(cursor)
+        
+    def test_bulk_create_chapters(self):
+        payload = [
+            {"manga_id": "1", "chapter_number": str(n), "title": f"Bulk {n}", "release_date": "2025-07-01T00:00:00", "language": "en"}
+            for n in range(2, 6)
+        ]
+        payload.append({"manga_id": "1", "chapter_number": "chapter 1", "title": "Dup", "release_date": "2025-07-01T00:00:00"})
+        payload.append({"manga_id": "1", "chapter_number": "3", "title": "Dup in batch", "release_date": "2025-07-01T00:00:00"})
+        payload.append({"manga_id": "1", "title": "No number"})
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        response = self.client.post('/chapter/bulk', json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json['created'], response.json['duplicates'], response.json['invalid']), (4, 2, 1))
+        self.assertEqual([r['status'] for r in response.json['results']], ['created'] * 4 + ['duplicate', 'duplicate', 'invalid'])
+        self.assertEqual(len([s for s in statements if s.startswith('INSERT INTO chapter ')]), 1)
+        
+        response = self.client.get(f'/chapter/manga/{self.manga_id}')
+        self.assertEqual([c['chapter_number'] for c in response.json['chapters']], ["chapter 1", "2", "3", "4", "5"])
+        self.assertEqual(self.client.get('/chapter/search?title=bulk').json['total_results'], 4)
+        
+    def test_bulk_create_chapters_rejects_mixed_manga(self):
+        payload = [
+            {"manga_id": "1", "chapter_number": "2", "release_date": "2025-07-01T00:00:00"},
+            {"manga_id": "2", "chapter_number": "3", "release_date": "2025-07-01T00:00:00"}
+        ]
+        response = self.client.post('/chapter/bulk', json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/chapter/bulk', json=payload[1:], headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 404)
+        
+    def test_get_chapters_by_manga_id_paged_and_filtered(self):
+        manga = Manga(title="Uuid Manga", author="Author", status="Ongoing", cover_url="x", genre="Action", book_type="Manga", published_date=datetime.today().date(), rating=1, views=1)
+        with self.app.app_context():
+            db.session.add(manga)
+            db.session.flush()
+            manga_id = manga.id
+            for day in range(1, 6):
+                db.session.add(Chapter(chapter_number=str(day), title=f"Day {day}", release_date=datetime(2025, 3, day), language='en', manga_id=manga_id))
+            db.session.add(Chapter(chapter_number="1", release_date=datetime(2025, 3, 1), language='fr', manga_id=manga_id))
+            db.session.commit()
+        
+        response = self.client.get(f'/chapter/manga/{manga_id}?language=en&per_page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['chapter_number'] for c in response.json['chapters']], ["1", "2"])
+        self.assertEqual(set(response.json['chapters'][0]), {'id', 'manga_id', 'chapter_number', 'language', 'sort_key', 'release_date'})
+        self.assertEqual(response.json['chapters'][0]['manga_id'], manga_id)
+        
+        response = self.client.get(f"/chapter/manga/{manga_id}?language=en&per_page=2&cursor={response.json['next_cursor']}")
+        self.assertEqual([c['chapter_number'] for c in response.json['chapters']], ["3", "4"])
+        
+        response = self.client.get(f'/chapter/manga/{manga_id}?released_after=2025-03-02&released_before=2025-03-04')
+        self.assertEqual([c['chapter_number'] for c in response.json['chapters']], ["2", "3"])
+        self.assertEqual(self.client.get(f'/chapter/manga/{manga_id}?released_after=soon').status_code, 400)
+        
+    def test_manga_chapter_listing_reads_only_the_covering_index(self):
+        with self.app.app_context():
+            statements = []
+            listener = lambda conn, cursor, statement, params, context, many: statements.append((statement, params))
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            with self.app.test_request_context(f'/chapter/manga/{self.manga_id}?language=en&released_after=2025-01-01'):
+                get_chapters_by_manga_id.__wrapped__.__wrapped__(manga_id=str(self.manga_id))
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            
+            statement, params = statements[-1]
+            plan = ' '.join(row[3] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params))
+            self.assertIn("USING COVERING INDEX ix_chapter_manga_listing", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
@@ -1,9 +1,11 @@
 import unittest
 from app import create_app
-from app.models import db, Download, Chapter, Manga, User
+from app.models import db, Download, Chapter, Manga, User, daily_chapter_downloads, daily_manga_downloads
 from datetime import datetime
 import json
+from sqlalchemy import event, text, delete
 from app.utils.util import encode_token
+from app.utils.download_filter import DownloadFilter
 
 class DownloadRouteTest(unittest.TestCase):
     
@@ -108,6 +110,14 @@ class DownloadRouteTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("downloads", response.get_json())
     
+    def test_get_downloads_cursor_rejects_empty_page(self):
+        response = self.client.get(
+            "/download/?cursor=&per_page=0",
+            headers={'Authorization': f"Bearer {self.admin_token}"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['message'], 'per_page must be at least 1')
+
     def test_user_cannot_get_all_downloads(self):
         response = self.client.get(
             "/download/",
@@ -131,6 +141,25 @@ class DownloadRouteTest(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 200)
     
+    def test_update_download_to_downloaded_chapter(self):
+        with self.app.app_context():
+            chapter = Chapter(chapter_number='chapter 2', release_date=datetime.today().date(), language="en", manga_id='1')
+            db.session.add(chapter)
+            db.session.commit()
+            db.session.add(Download(user_id=self.user_id, chapter_id=chapter.id))
+            db.session.commit()
+            chapter_id = chapter.id
+
+        response = self.client.put(
+            f"/download/{self.download_id}",
+            json={"chapter_id": chapter_id},
+            headers={'Authorization': f"Bearer {self.user_token}"}
+        )
+        self.assertEqual(response.status_code, 409)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Download, self.download_id).chapter_id, self.chapter_id)
+
     def test_update_download_forbidden(self):
         response = self.client.put(
             f"/download/{self.download_id}",
@@ -159,4 +188,101 @@ class DownloadRouteTest(unittest.TestCase):
         
     def test_delete_download_no_token(self):
         response = self.client.delete(f"/download/{self.download_id}")
-        self.assertEqual(response.status_code, 401)
\ No newline at end of file
+        self.assertEqual(response.status_code, 401)
+        
+    def _post_download(self, chapter_id):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        response = self.client.post("/download/", json={"chapter_id": chapter_id}, headers={'Authorization': f"Bearer {self.user_token}"})
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return response, [s for s in statements if 'download' in s]
+        
+    def test_repeat_download_answered_from_filter(self):
+        with self.app.app_context():
+            chapter = Chapter(chapter_number='chapter 2', release_date=datetime.today().date(), language="en", manga_id='1')
+            db.session.add(chapter)
+            db.session.commit()
+            chapter_id = chapter.id
+            
+        response, _ = self._post_download(chapter_id)
+        self.assertEqual(response.status_code, 201)
+        download_id = response.json['download']['id']
+        
+        # SimpleCache is per process, so the hit is confirmed through the unique index, never inserted
+        response, statements = self._post_download(chapter_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('SELECT'))
+        
+        self.client.delete(f"/download/{download_id}", headers={'Authorization': f"Bearer {self.user_token}"})
+        response, _ = self._post_download(chapter_id)
+        self.assertEqual(response.status_code, 201)
+        
+    def test_shared_cache_answers_repeat_from_filter(self):
+        with self.app.app_context():
+            self.app.extensions['download_filter'] = DownloadFilter(1024, shared=True)
+        response, _ = self._post_download(self.chapter_id)
+        self.assertEqual(response.status_code, 409)
+        response, statements = self._post_download(self.chapter_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(statements, [])
+        
+    def test_download_removed_by_another_worker(self):
+        response, _ = self._post_download(self.chapter_id)
+        self.assertEqual(response.status_code, 409)
+        with self.app.app_context():
+            # a delete on another worker bumps the tag in its own SimpleCache, not this one
+            db.session.execute(delete(Download).where(Download.id == self.download_id))
+            db.session.commit()
+        
+        response, _ = self._post_download(self.chapter_id)
+        self.assertEqual(response.status_code, 201)
+        
+    def test_dedupe_downloads_command(self):
+        with self.app.app_context():
+            db.session.execute(text("DROP INDEX ux_download_user_id_chapter_id"))
+            db.session.add_all([Download(user_id=self.user_id, chapter_id=self.chapter_id) for _ in range(3)])
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['dedupe-downloads', '--chunk-size', '2'])
+        self.assertIn("Deleted 3 duplicate downloads", result.output)
+        with self.app.app_context():
+            self.assertEqual([d.id for d in db.session.query(Download).all()], [self.download_id])
+            
+    def test_download_counters_and_top(self):
+        with self.app.app_context():
+            manga = Manga(id='2', title='Other Manga', author='Author', status='Ongoing', cover_url='x', genre='Action', book_type='Manga', published_date=datetime.today().date(), rating=1, views=1)
+            chapters = [Chapter(id=f"x{i}", chapter_number=str(i), release_date=datetime.today().date(), language="en", manga_id='2') for i in range(2)]
+            db.session.add_all([manga, *chapters])
+            db.session.commit()
+            db.session.add_all([Download(user_id=self.admin_id, chapter_id='x0'), Download(user_id=self.admin_id, chapter_id='x1')])
+            db.session.commit()
+            
+        self._post_download('x0')
+        response, _ = self._post_download('x1')
+        self.client.delete(f"/download/{response.json['download']['id']}", headers={'Authorization': f"Bearer {self.user_token}"})
+        
+        def top(query):
+            response = self.client.get(f"/download/stats/top?{query}", headers={'Authorization': f"Bearer {self.admin_token}"})
+            self.assertEqual(response.status_code, 200, response.json)
+            key = f"{response.json['by']}_id"
+            return [(entry[key], entry['downloads']) for entry in response.json['top']]
+        
+        self.assertEqual(top('by=manga&window=7d'), [('2', 3), ('1', 1)])
+        self.assertEqual(top('by=chapter&window=all&limit=1'), [('x0', 2)])
+        
+        with self.app.app_context():
+            counts = lambda: sorted(db.session.execute(daily_chapter_downloads.select()).all()) + sorted(db.session.execute(daily_manga_downloads.select()).all())
+            before = counts()
+            db.session.execute(daily_manga_downloads.delete())
+            db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=['rebuild-download-counts'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            self.assertEqual(counts(), before)
+            
+        response = self.client.get("/download/stats/top?window=week", headers={'Authorization': f"Bearer {self.admin_token}"})
+        self.assertEqual(response.status_code, 400)
@@ -1,10 +1,20 @@
 import unittest
 from app import create_app
-from app.models import db, Manga, User
+from app.models import db, Manga, User, Genre
 import json
+import gzip
 from werkzeug.security import generate_password_hash
 from app.utils.util import encode_token
+from app.utils.pagination import order_by_clauses, keyset_after
+from sqlalchemy.dialects import mysql
+from app.blueprints.manga.routes import manga_order
+from app.blueprints.manga.schema import MangaSchema, manga_schema
+from app.utils.serializers import row_serializer
+from sqlalchemy import select, update, delete, text, event
+from sqlalchemy.orm import Session
 from datetime import date
+import time
+from app.extensions import cache, tag_version
 
 class MangaRouteTests(unittest.TestCase):
     
@@ -223,4 +233,430 @@ class MangaRouteTests(unittest.TestCase):
     
     def test_delete_manga_no_token(self):
         response = self.client.delete(f"/manga/{self.manga_id}")
-        self.assertEqual(response.status_code, 401)
\ No newline at end of file
+        self.assertEqual(response.status_code, 401)
+        
+    def test_get_mangas_cursor_pagination(self):
+        with self.app.app_context():
+            for i in range(2, 6):
+                db.session.add(Manga(
+                    id=i,
+                    title=f"Title {i}",
+                    author="Test Author",
+                    status="Ongoing",
+                    cover_url="https://example.com/default-cover.jpg",
+                    genre="Action",
+                    book_type="Manga",
+                    published_date=date(2025, 6, 2),
+                    rating=4.0,
+                    views=i,
+                    description="Test Description"
+                ))
+            db.session.commit()
+            
+        seen = []
+        response = self.client.get('/manga/?cursor=&per_page=2')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(m['id'] for m in response.json['mangas'])
+            if response.json['next_cursor'] is None:
+                break
+            response = self.client.get(f"/manga/?cursor={response.json['next_cursor']}&per_page=2")
+            
+        self.assertEqual(seen, ['1', '2', '3', '4', '5'])
+        
+    def test_get_mangas_invalid_cursor(self):
+        response = self.client.get('/manga/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid cursor', response.get_data(as_text=True))
+        
+    def test_search_mangas_ranks_title_matches_first(self):
+        payload = {
+            "title": "Dragon Quest",
+            "author": "Author Test",
+            "status": "Ongoing",
+            "cover_url": "https://example.com/test-cover.jpg",
+            "genre": "Action",
+            "book_type": "Manga",
+            "published_date": "2025-06-05",
+            "rating": 4.15,
+            "views": 100,
+            "description": "A long journey"
+        }
+        self.client.post("/manga/", json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        self.client.post(
+            "/manga/",
+            json={**payload, "title": "Side Story", "description": "A dragon appears once"},
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        
+        response = self.client.get('/manga/search?q=dragon')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_results'], 2)
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Dragon Quest", "Side Story"])
+        
+        response = self.client.get('/manga/search?q=dragon&page=2&per_page=1')
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Side Story"])
+        
+    def test_search_index_follows_updates_and_deletes(self):
+        response = self.client.get('/manga/search?q=test')
+        self.assertEqual(response.json['total_results'], 1)
+        
+        self.client.put(
+            f'/manga/{self.manga_id}',
+            json={"title": "Renamed", "author": "Someone", "description": "Nothing"},
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        self.assertEqual(self.client.get('/manga/search?q=test').json['total_results'], 0)
+        self.assertEqual(self.client.get('/manga/search?q=renamed').json['total_results'], 1)
+        
+        self.client.delete(f'/manga/{self.manga_id}', headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(self.client.get('/manga/search?q=renamed').json['total_results'], 0)
+        
+    def test_search_mangas_requires_query(self):
+        response = self.client.get('/manga/search')
+        self.assertEqual(response.status_code, 400)
+        
+    def _create_manga(self, title, genre):
+        payload = {
+            "title": title,
+            "author": "Author Test",
+            "status": "Ongoing",
+            "cover_url": "https://example.com/test-cover.jpg",
+            "genre": genre,
+            "book_type": "Manga",
+            "published_date": "2025-06-05",
+            "rating": 4.15,
+            "views": 100,
+            "description": "Description Test"
+        }
+        return self.client.post("/manga/", json=payload, headers={'Authorization': f"Bearer {self.token}"})
+        
+    def test_filter_mangas_by_genre(self):
+        self._create_manga("Both", "Action, Isekai")
+        self._create_manga("Only Isekai", "Isekai")
+        
+        response = self.client.get('/manga/?genre=Action&genre=Isekai')
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Both"])
+        self.assertEqual(response.json['total_mangas'], 1)
+        
+        response = self.client.get('/manga/?genre=action&genre=isekai&genre_mode=any')
+        self.assertEqual(sorted(m['title'] for m in response.json['mangas']), ["Both", "Only Isekai"])
+        
+    def test_genre_facets(self):
+        self._create_manga("Both", "Action, Isekai")
+        self._create_manga("Only Isekai", "Isekai")
+        
+        response = self.client.get('/manga/genres')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['genres'], [
+            {'name': 'Isekai', 'count': 2},
+            {'name': 'Action', 'count': 1}
+        ])
+        
+        response = self.client.get('/manga/genres?genre=Action')
+        self.assertEqual(response.json['genres'], [
+            {'name': 'Action', 'count': 1},
+            {'name': 'Isekai', 'count': 1}
+        ])
+        
+    def test_genres_reused_regardless_of_case(self):
+        self._create_manga("Upper", "Action")
+        self._create_manga("Lower", "action, ISEKAI, isekai")
+        
+        with self.app.app_context():
+            self.assertEqual(sorted(db.session.execute(select(Genre.name)).scalars()), ["Action", "ISEKAI"])
+            query = select(Genre.id).where(Genre.name.in_(["action", "isekai"])).compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {query}"))
+            self.assertIn('USING COVERING INDEX sqlite_autoindex_genre_1', plan)
+            
+        response = self.client.get('/manga/?genre=Isekai')
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Lower"])
+        
+    def test_migrate_genres_command(self):
+        with self.app.app_context():
+            manga = db.session.get(Manga, '1')
+            manga.genre = "Action / Fantasy"
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['migrate-genres'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        
+        response = self.client.get('/manga/?genre=Fantasy&genre=Action')
+        self.assertEqual(response.json['total_mangas'], 1)
+        
+    def test_get_mangas_sorted(self):
+        self._create_manga("Popular", "Action")
+        with self.app.app_context():
+            manga = db.session.execute(select(Manga).where(Manga.title == "Popular")).scalar_one()
+            manga.views = 5000
+            db.session.commit()
+            
+        response = self.client.get('/manga/?sort=-views')
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Popular", "Test Title"])
+        
+        response = self.client.get('/manga/?sort=-views&cursor=&per_page=1')
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Popular"])
+        response = self.client.get(f"/manga/?sort=-views&cursor={response.json['next_cursor']}&per_page=1")
+        self.assertEqual([m['title'] for m in response.json['mangas']], ["Test Title"])
+        
+    def test_rating_cursor_ties_page_through(self):
+        for title in ("Tied A", "Tied B"):
+            self._create_manga(title, "Action")
+        with self.app.app_context():
+            for manga in db.session.execute(select(Manga)).scalars():
+                manga.rating = 4.7
+            db.session.commit()
+            
+        titles = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(f'/manga/?sort=-rating&per_page=1&cursor={cursor}')
+            titles.extend(m['title'] for m in response.json['mangas'])
+            cursor = response.json['next_cursor']
+        self.assertEqual(len(titles), 3)
+        self.assertEqual(len(set(titles)), 3)
+        
+        # MySQL FLOAT is single precision; the cursor value is compared at that precision
+        dialect = mysql.dialect()
+        dialect.server_version_info = (8, 0, 30)
+        clause = keyset_after(manga_order('-rating'), [4.7, 'x'])
+        self.assertIn("CAST(%s AS FLOAT)", str(clause.compile(dialect=dialect)))
+        
+    def test_get_mangas_invalid_sort(self):
+        response = self.client.get('/manga/?sort=-description')
+        self.assertEqual(response.status_code, 400)
+        
+    def test_sorted_pages_use_index(self):
+        expected = {
+            '-views': 'ix_manga_views_id',
+            'views': 'ix_manga_views_id',
+            '-rating': 'ix_manga_rating_id',
+            'published_date': 'ix_manga_published_date_id',
+            'title': 'ix_manga_title_id'
+        }
+        
+        with self.app.app_context():
+            for sort, index in expected.items():
+                query = select(Manga).order_by(*order_by_clauses(manga_order(sort))).offset(20).limit(10)
+                sql = str(query.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                plan = ' '.join(row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+                
+                self.assertIn(f"USING INDEX {index}", plan)
+                self.assertNotIn("TEMP B-TREE", plan)
+        
+    def test_manga_reads_are_cached_until_invalidated(self):
+        self._create_manga("Other", "Action")
+        with self.app.app_context():
+            other_id = db.session.execute(select(Manga.id).where(Manga.title == "Other")).scalar_one()
+            
+        self.assertEqual(self.client.get(f'/manga/{self.manga_id}').json['title'], "Test Title")
+        self.assertEqual(self.client.get(f'/manga/{other_id}').json['title'], "Other")
+        
+        with self.app.app_context():
+            # a Core update leaves version alone, so only the tag can tell the cache about it
+            db.session.execute(update(Manga).where(Manga.id == other_id).values(title="Changed Behind The Cache"))
+            db.session.commit()
+            
+        self.client.put(
+            f'/manga/{self.manga_id}',
+            json={"title": "Renamed"},
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        
+        self.assertEqual(self.client.get(f'/manga/{self.manga_id}').json['title'], "Renamed")
+        self.assertEqual(self.client.get(f'/manga/{other_id}').json['title'], "Other")
+        
+    def test_tag_versions_expire_with_the_cache_timeout(self):
+        self.app.config['CACHE_DEFAULT_TIMEOUT'] = 1
+        cache.init_app(self.app)
+        with self.app.app_context():
+            version = tag_version(f'manga:{self.manga_id}')
+            self.assertEqual(tag_version(f'manga:{self.manga_id}'), version)
+            time.sleep(1.1)
+            self.assertNotEqual(tag_version(f'manga:{self.manga_id}'), version)
+        
+    def test_get_manga_conditional_get(self):
+        response = self.client.get(f'/manga/{self.manga_id}')
+        etag = response.headers['ETag']
+        self.assertEqual(response.headers['Surrogate-Key'], f'manga:{self.manga_id}')
+        self.assertIn('Last-Modified', response.headers)
+        
+        response = self.client.get(f'/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        
+        self.client.put(
+            f'/manga/{self.manga_id}',
+            json={"views": 101},
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        
+        response = self.client.get(f'/manga/{self.manga_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['version'], 2)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        
+    def test_concurrent_manga_update_conflicts(self):
+        def update_elsewhere(session, context, instances):
+            # another writer commits between this request's load and its flush
+            with db.engine.begin() as conn:
+                conn.execute(update(Manga).where(Manga.id == self.manga_id).values(title="Elsewhere", version=Manga.version + 1))
+        
+        event.listen(Session, 'before_flush', update_elsewhere, once=True)
+        try:
+            response = self.client.put(
+                f'/manga/{self.manga_id}',
+                json={"title": "Renamed"},
+                headers={'Authorization': f"Bearer {self.token}"}
+            )
+        finally:
+            if event.contains(Session, 'before_flush', update_elsewhere):
+                event.remove(Session, 'before_flush', update_elsewhere)
+        self.assertEqual(response.status_code, 409)
+        
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Manga, self.manga_id).title, "Elsewhere")
+        
+    def test_upgrade_schema_adds_missing_columns_and_indexes(self):
+        with self.app.app_context():
+            db.session.execute(text("DROP INDEX ix_manga_views_id"))
+            db.session.execute(text("ALTER TABLE manga DROP COLUMN updated_at"))
+            db.session.commit()
+            
+        result = self.app.test_cli_runner().invoke(args=['upgrade-schema'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Added column manga.updated_at", result.output)
+        self.assertIn("Created index ix_manga_views_id", result.output)
+        
+    def test_get_mangas_sparse_fields(self):
+        statements = []
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+            
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            response = self.client.get('/manga/?fields=id,title,cover_url')
+        finally:
+            with self.app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', capture)
+                
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json['mangas'][0]), {'id', 'title', 'cover_url'})
+        page_query = [s for s in statements if 'LIMIT' in s][0]
+        self.assertNotIn('description', page_query)
+        
+    def test_get_manga_by_id_sparse_fields(self):
+        response = self.client.get(f'/manga/{self.manga_id}?fields=title')
+        self.assertEqual(response.json, {'title': 'Test Title'})
+        
+        response = self.client.get(f'/manga/{self.manga_id}?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+        
+    def test_row_serializer_matches_schema(self):
+        with self.app.app_context():
+            serializer = row_serializer(MangaSchema)
+            row = db.session.execute(serializer.select()).one()
+            manga = db.session.get(Manga, self.manga_id)
+            
+            self.assertEqual(serializer.serialize(row), manga_schema.dump(manga))
+            
+    def _catalog(self, *titles):
+        lines = []
+        for title in titles:
+            lines.append(json.dumps({
+                "type": "manga",
+                "id": f"id-{title}",
+                "title": title,
+                "author": "Catalog Author",
+                "status": "Ongoing",
+                "cover_url": "https://example.com/cover.jpg",
+                "genre": "Action, Drama",
+                "book_type": "Manga",
+                "published_date": "2024-01-01",
+                "rating": 4.0,
+                "views": 10
+            }))
+            lines.append(json.dumps({
+                "type": "chapter",
+                "manga_id": f"id-{title}",
+                "chapter_number": "1",
+                "title": f"{title} 1",
+                "release_date": "2024-01-02",
+                "language": "en"
+            }))
+        return "\n".join(lines) + "\n"
+        
+    def test_import_catalog_endpoint(self):
+        body = self._catalog("Alpha", "Beta") + "not json\n" + json.dumps({"type": "chapter", "manga_id": "missing", "chapter_number": "1", "title": "x", "release_date": "2024-01-01", "language": "en"}) + "\n"
+        response = self.client.post('/manga/import?chunk_size=3', data=body, headers={'Authorization': f"Bearer {self.token}"})
+        self.assertEqual(response.status_code, 200)
+        reports = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        
+        self.assertEqual([r['last_line'] for r in reports], [3, 6])
+        self.assertEqual(sum(r['manga_inserted'] for r in reports), 2)
+        self.assertEqual(sum(r['chapters_inserted'] for r in reports), 2)
+        self.assertEqual([p['line'] for r in reports for p in r['invalid']], [5, 6])
+        
+        response = self.client.get('/manga/?genre=Drama')
+        self.assertEqual(sorted(m['title'] for m in response.json['mangas']), ["Alpha", "Beta"])
+        response = self.client.get('/manga/search?q=alpha')
+        self.assertEqual(response.json['mangas'][0]['title'], "Alpha")
+        
+    def test_import_catalog_skips_duplicates_and_resumes(self):
+        body = self._catalog("Alpha", "Beta")
+        response = self.client.post('/manga/import?skip=2', data=body, headers={'Authorization': f"Bearer {self.token}"})
+        report = json.loads(response.get_data(as_text=True))
+        self.assertEqual((report['first_line'], report['manga_inserted']), (3, 1))
+        
+        response = self.client.post('/manga/import', data=body, headers={'Authorization': f"Bearer {self.token}"})
+        report = json.loads(response.get_data(as_text=True))
+        self.assertEqual((report['manga_inserted'], report['chapters_inserted'], report['duplicates']), (1, 1, 2))
+        
+    def test_import_catalog_requires_admin(self):
+        user_token = encode_token('2', role='user')
+        response = self.client.post('/manga/import', data=self._catalog("Alpha"), headers={'Authorization': f"Bearer {user_token}"})
+        self.assertEqual(response.status_code, 403)
+        
+    def test_import_catalog_command(self):
+        runner = self.app.test_cli_runner()
+        with runner.isolated_filesystem():
+            with open('catalog.ndjson', 'w') as f:
+                f.write(self._catalog("Alpha", "Beta", "Gamma"))
+            result = runner.invoke(args=['import-catalog', 'catalog.ndjson', '--chunk-size', '4'])
+            
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 3 manga and 3 chapters", result.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Manga).count(), 4)
+            
+    def test_export_mangas_streams_ndjson_with_resume_tokens(self):
+        self._create_manga("Second", "Action")
+        self._create_manga("Third", "Action")
+        
+        response = self.client.get('/manga/export?batch_size=2')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([line['type'] for line in lines], ['manga', 'manga', 'checkpoint', 'manga', 'checkpoint', 'end'])
+        
+        response = self.client.get(f"/manga/export?batch_size=2&resume_token={lines[2]['resume_token']}")
+        resumed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['id'] for line in resumed if line['type'] == 'manga'], [lines[3]['id']])
+        
+        response = self.client.get('/manga/export?resume_token=garbage')
+        self.assertEqual(response.status_code, 400)
+        
+    def test_export_gzip_round_trips_through_import(self):
+        response = self.client.get('/manga/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        body = gzip.decompress(response.get_data())
+        
+        with self.app.app_context():
+            db.session.execute(delete(Manga))
+            db.session.commit()
+        
+        response = self.client.post('/manga/import', data=body, headers={'Authorization': f"Bearer {self.token}"})
+        report = json.loads(response.get_data(as_text=True))
+        self.assertEqual((report['manga_inserted'], report['invalid']), (1, []))
+        self.assertEqual(self.client.get(f'/manga/{self.manga_id}').json['title'], self.manga_title)
@@ -0,0 +1,63 @@
+import unittest
+import tracemalloc
+from app import create_app
+from app.models import db, User, ReadingHistory
+from datetime import datetime
+from sqlalchemy import insert
+from app.utils.util import encode_token
+
+class ReadingHistoryRouteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app("TestingConfig")
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            self.admin = User(username='adminuser', email='admin@test.com', password='hashed', role='admin')
+            db.session.add(self.admin)
+            db.session.commit()
+            self.admin_token = encode_token(str(self.admin.id), role='admin')
+
+    def _add_history(self, count):
+        with self.app.app_context():
+            read_at = datetime(2025, 1, 1)
+            for start in range(0, count, 50000):
+                db.session.execute(insert(ReadingHistory), [
+                    {'user_id': i // 1000 + 1, 'manga_id': str(i % 1000), 'last_chapter': f"chapter-{i}", 'last_read_at': read_at}
+                    for i in range(start, min(start + 50000, count))
+                ])
+            db.session.commit()
+
+    def test_reading_history_is_a_valid_json_array(self):
+        self._add_history(2500)
+        response = self.client.get('/history/', headers={'Authorization': f"Bearer {self.admin_token}"})
+
+        self.assertEqual(response.status_code, 200)
+        history = response.json['reading_history']
+        self.assertEqual(len(history), 2500)
+        self.assertEqual(history[-1]['last_chapter'], 'chapter-2499')
+
+        response = self.client.get('/history/admin/user/999', headers={'Authorization': f"Bearer {self.admin_token}"})
+        self.assertEqual(response.json, {'reading_history': []})
+
+    def test_reading_history_streams_in_bounded_memory(self):
+        rows = 500000
+        self._add_history(rows)
+
+        tracemalloc.start()
+        try:
+            response = self.client.get('/history/', headers={'Authorization': f"Bearer {self.admin_token}"}, buffered=False)
+            size = 0
+            for chunk in response.response:
+                size += len(chunk)
+            response.close()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # the body alone is ~40MB; streaming keeps one batch of rows and JSON alive at a time
+        self.assertGreater(size, rows * 60)
+        self.assertLess(peak, 10 * 1024 * 1024)